@@ -2,7 +2,10 @@ import React, { useState, useEffect, useRef } from "react";
 import '../styles/GamePlay.css';
 import GameOver from './GameOver';
 
-function GamePlay({ questions, onFinish, gameData }) {
+function GamePlay({ questions: initialQuestions, onFinish, gameData }) {
+    // Games started on the first streamed questions receive the rest while playing
+    const [questions, setQuestions] = useState(initialQuestions);
+    const questionsRef = useRef(initialQuestions);
     const [currentQuestion, setCurrentQuestion] = useState(0); // state for our current questions and answers to ask
     const [showAnswer, setShowAnswer] = useState(false); // state to determine when and how long to show answer
     const [gameCompleted, setGameCompleted] = useState(false); // state to set if game completed or not
@@ -83,7 +86,7 @@ function GamePlay({ questions, onFinish, gameData }) {
                 setHasAnswered(false);
                 playerTimesRef.current = {}; // Reset player times
             
-                if (data.currentQuestion < questions.length) {
+                if (data.currentQuestion < questionsRef.current.length) {
                     setCurrentQuestion(data.currentQuestion);
                     setCurrentContext(data.context || ""); // Set context
                     // Use timeLeft if provided, otherwise fall back to timePerQuestion
@@ -112,6 +115,11 @@ function GamePlay({ questions, onFinish, gameData }) {
                 setGameCompleted(true);
             }      
 
+            if (data.type === 'questions_added') {
+                questionsRef.current = data.questions;
+                setQuestions(data.questions);
+            }
+
             if (data.type === 'game_started') {
                 console.log('Game started message received');
                 // Use timeLeft if provided, otherwise fall back to timePerQuestion
@@ -121,14 +129,14 @@ function GamePlay({ questions, onFinish, gameData }) {
 
         setWs(websocket);
 
-        if (questions.length > 0) {
-            setCurrentContext(questions[0]?.context || "");
+        if (initialQuestions.length > 0) {
+            setCurrentContext(initialQuestions[0]?.context || "");
         }
 
         return () => {
             websocket.close();
         };
-    }, [gameData.gameCode, gameData.playerName, questions, onFinish, gameData.timePerQuestion]);
+    }, [gameData.gameCode, gameData.playerName, initialQuestions, onFinish, gameData.timePerQuestion]);
 
     // Handle page navigation and refresh
     useEffect(() => {
@@ -68,6 +68,16 @@ const Lobby = ({ gameData, startGame, onBack }) => {
                             // Use the message and progress directly from the server
                             setStatusMessage(data.message || 'Processing...');
                             setProgress(data.progress || 0);
+                            if (data.first_questions_ready) {
+                                // Enough questions to start; the rest are added to the running game
+                                const questionsResponse = await fetch(`http://localhost:5000/api/questions?gameCode=${gameData.gameCode}`);
+                                const questionsData = await questionsResponse.json();
+                                if (questionsData.questions && questionsData.questions.length > 0) {
+                                    setQuestions(questionsData.questions);
+                                    setIsProcessing(false);
+                                    setStatusMessage(`${questionsData.questions.length} of ${data.total_questions} questions ready, the rest will be added during the game`);
+                                }
+                            }
                             break;
                         }
                         case 'ready': {
@@ -276,6 +286,7 @@ const Lobby = ({ gameData, startGame, onBack }) => {
                     <div className="questions-ready">
                         <div className="success-icon">✓</div>
                         <h3>Questions are ready!</h3>
+                        {gameData.isHost && statusMessage && <p className="status-message">{statusMessage}</p>}
                         {gameData.isHost ? (
                             <button onClick={handleStartGame} className="start-game-button">
                                 Start Game
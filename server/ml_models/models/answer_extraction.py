@@ -0,0 +1,147 @@
+"""
+Batched extractive question answering.
+
+Runs (question, context) pairs through the RoBERTa QA model in padded batches
+instead of calling the Hugging Face pipeline once per question. Long contexts
+are split into overlapping token windows so the whole chunk is searched. Span scoring
+follows the `question-answering` pipeline: start/end probabilities are
+softmaxed over the context tokens (plus CLS), CLS is then excluded, and the
+best span no longer than `max_answer_len` tokens wins.
+"""
+
+import logging
+from typing import List, Tuple
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max())
+    return exp / exp.sum()
+
+
+def best_span(start_logits: np.ndarray, end_logits: np.ndarray, context_mask: np.ndarray,
+              max_answer_len: int = 50) -> Tuple[int, int, float]:
+    """Return (start token, end token, score) of the most probable answer span."""
+    # Like the pipeline, CLS takes part in the normalisation but can't be the answer
+    undesired = ~context_mask
+    undesired[0] = False
+    start = _softmax(np.where(undesired, -10000.0, start_logits))
+    end = _softmax(np.where(undesired, -10000.0, end_logits))
+    start[0] = end[0] = 0.0
+
+    # Score every (start, end) pair with start <= end < start + max_answer_len
+    candidates = np.tril(np.triu(np.outer(start, end)), max_answer_len - 1)
+    flat_idx = int(np.argmax(candidates))
+    start_idx, end_idx = np.unravel_index(flat_idx, candidates.shape)
+    return int(start_idx), int(end_idx), float(candidates[start_idx, end_idx])
+
+
+def encode_with_context_ids(question_ids: List[int], context_ids: np.ndarray, tokenizer,
+                            max_seq_length: int = 384) -> Tuple[List[int], np.ndarray]:
+    """Input ids and context mask for a question and an already tokenized context, as one window.
+
+    The context is cut to what fits next to the question. Its positions are found
+    by building the pair with placeholder ids, so any special-token layout works.
+    """
+    budget = max_seq_length - len(question_ids) - tokenizer.num_special_tokens_to_add(pair=True)
+    context_ids = np.asarray(context_ids[:max(budget, 0)], dtype=np.int64)
+    input_ids = np.array(tokenizer.build_inputs_with_special_tokens(list(question_ids), [-1] * len(context_ids)))
+    context_mask = input_ids == -1
+    input_ids[context_mask] = context_ids
+    return input_ids.tolist(), context_mask
+
+
+@torch.no_grad()
+def extract_best_answers(pairs: List[Tuple[str, str]], model, tokenizer, batch_size: int = 16,
+                         max_seq_length: int = 384, doc_stride: int = 128,
+                         max_answer_len: int = 50, context_ids: List = None) -> List[Tuple[str, float]]:
+    """Extract the best (answer, score) for each (question, context) pair.
+
+    Each context is covered in full by overlapping token windows of
+    `max_seq_length` tokens (overlapping by `doc_stride`). Windows from all
+    pairs are run through the model in padded batches of `batch_size`, and the
+    best span across a pair's windows is returned.
+
+    `context_ids` may give, per pair, the context's (token ids, character spans)
+    from a chunk store, or None. Those contexts aren't tokenized again and are
+    run as a single window.
+    """
+    if not pairs:
+        return []
+
+    device = next(model.parameters()).device
+    questions = [question.lstrip() for question, _ in pairs]
+    contexts = [context for _, context in pairs]
+    best = [("No valid answers found", 0.0)] * len(pairs)
+    context_ids = context_ids or [None] * len(pairs)
+
+    # Each window is (sample, input ids, context mask, character offsets of its tokens)
+    windows = []
+    try:
+        pretokenized = [i for i, ids in enumerate(context_ids) if ids is not None]
+        if pretokenized:
+            question_ids = tokenizer([questions[i] for i in pretokenized], add_special_tokens=False)["input_ids"]
+            for i, q_ids in zip(pretokenized, question_ids):
+                ids, spans = context_ids[i]
+                input_ids, context_mask = encode_with_context_ids(q_ids, ids, tokenizer, max_seq_length)
+                offsets = np.zeros((len(input_ids), 2), dtype=np.int64)
+                offsets[context_mask] = np.asarray(spans[:int(context_mask.sum())])
+                windows.append((i, input_ids, context_mask, offsets))
+
+        rest = [i for i, ids in enumerate(context_ids) if ids is None]
+        if rest:
+            encoded = tokenizer(
+                [questions[i] for i in rest],
+                [contexts[i] for i in rest],
+                truncation="only_second",
+                max_length=max_seq_length,
+                stride=doc_stride,
+                return_overflowing_tokens=True,
+                return_offsets_mapping=True
+            )
+            for row, sample in enumerate(encoded["overflow_to_sample_mapping"]):
+                context_mask = np.array([seq_id == 1 for seq_id in encoded.sequence_ids(row)])
+                windows.append((rest[sample], encoded["input_ids"][row], context_mask,
+                                encoded["offset_mapping"][row]))
+    except Exception as e:
+        print(f"Error extracting answer: {str(e)}")
+        return [(f"Error extracting answer: {str(e)}", 0.0)] * len(pairs)
+
+    for start in range(0, len(windows), batch_size):
+        batch = windows[start:start + batch_size]
+        try:
+            features = tokenizer.pad(
+                {
+                    "input_ids": [input_ids for _, input_ids, _, _ in batch],
+                    "attention_mask": [[1] * len(input_ids) for _, input_ids, _, _ in batch]
+                },
+                padding="longest",
+                return_tensors="pt"
+            )
+            outputs = model(**{key: value.to(device) for key, value in features.items()})
+            start_logits = outputs.start_logits.cpu().numpy()
+            end_logits = outputs.end_logits.cpu().numpy()
+        except Exception as e:
+            print(f"Error extracting answer: {str(e)}")
+            for sample, _, _, _ in batch:
+                if best[sample][1] == 0.0:
+                    best[sample] = (f"Error extracting answer: {str(e)}", 0.0)
+            continue
+
+        for i, (sample, input_ids, context_mask, offsets) in enumerate(batch):
+            if not context_mask.any():
+                continue
+
+            # Padding in this batch extends past the window's own tokens
+            length = len(input_ids)
+            start_idx, end_idx, score = best_span(
+                start_logits[i][:length], end_logits[i][:length], context_mask, max_answer_len
+            )
+            if score > best[sample][1]:
+                best[sample] = (contexts[sample][offsets[start_idx][0]:offsets[end_idx][1]], score)
+
+    return best
@@ -0,0 +1,86 @@
+"""
+Answer-first question generation prompts.
+
+`valhalla/t5-base-qg-hl` is trained on contexts where the answer is wrapped in
+`<hl>` tokens. This module picks candidate answers from a chunk (named entities
+and noun chunks that Sense2Vec knows, so distractors can be found for them) and
+builds one highlighted prompt per candidate. The answer is known up front; the
+extractive QA model only scores the question, by whether it finds the same
+answer (`answer_matches`).
+"""
+
+import random
+import logging
+from typing import List, Tuple
+
+from distractor_generator import s2v
+from answer_similarity import normalize_text, are_similar_answers
+
+logger = logging.getLogger(__name__)
+
+SPACY_MODEL = "en_core_web_sm"
+_NLP = None
+
+# Determiners stripped from the front of noun chunks before lookup
+LEADING_WORDS = {"a", "an", "the", "this", "that", "these", "those", "its", "their", "his", "her"}
+
+
+def get_nlp():
+    """Load and cache the spaCy pipeline used to find candidate answers."""
+    global _NLP
+    if _NLP is None:
+        import spacy
+        logger.info(f"Loading spaCy model {SPACY_MODEL}...")
+        _NLP = spacy.load(SPACY_MODEL)
+    return _NLP
+
+
+def strip_leading_words(text: str, start: int) -> Tuple[str, int]:
+    """Drop leading determiners from a span, returning the new text and start offset."""
+    words = text.split(' ')
+    while len(words) > 1 and words[0].lower() in LEADING_WORDS:
+        start += len(words[0]) + 1
+        words = words[1:]
+    return ' '.join(words), start
+
+
+def select_answer_candidates(context: str, max_candidates: int = 3, max_words: int = 4) -> List[Tuple[int, int, str]]:
+    """Pick up to `max_candidates` answer spans (start, end, text) from the context.
+
+    Entities come before noun chunks, every candidate must have a Sense2Vec
+    sense, and each distinct answer is only used once per chunk.
+    """
+    doc = get_nlp()(context)
+    spans = list(doc.ents) + list(doc.noun_chunks)
+
+    candidates = []
+    seen = set()
+    for span in spans:
+        text, start = strip_leading_words(span.text.strip(), span.start_char)
+        if not text or len(text.split()) > max_words or text.lower() in seen:
+            continue
+        if not any(c.isalpha() for c in text):
+            continue
+        if context[start:start + len(text)] != text:
+            continue
+        if s2v.get_best_sense(text.replace(' ', '_')) is None:
+            continue
+        seen.add(text.lower())
+        candidates.append((start, start + len(text), text))
+
+    if len(candidates) > max_candidates:
+        candidates = random.sample(candidates, max_candidates)
+    return candidates
+
+
+def build_highlight_prompt(context: str, start: int, end: int) -> str:
+    """Wrap context[start:end] in <hl> tokens the way the QG model was trained."""
+    return f"{context[:start]}<hl> {context[start:end]} <hl>{context[end:]}"
+
+
+def answer_matches(chosen: str, extracted: str) -> bool:
+    """True if the QA model's answer is the chosen one, or one contains the other."""
+    chosen, extracted = normalize_text(chosen), normalize_text(extracted)
+    if not chosen or not extracted:
+        return False
+    return chosen in extracted or extracted in chosen or are_similar_answers(chosen, extracted)
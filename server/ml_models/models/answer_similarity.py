@@ -0,0 +1,155 @@
+"""
+Near-duplicate checks between answers and distractor candidates.
+
+`are_similar_answers` compares two texts after normalisation: exact match, a
+few known abbreviations, or a `difflib` ratio above 0.8. `similarity_mask` gives
+the same answer for every (candidate, reference) pair at once. It normalises
+each text once, then rules out most pairs with the `quick_ratio` bound
+(character multiset overlap, computed with NumPy), which is never below the
+real ratio. Only the pairs that survive run the exact `SequenceMatcher`.
+
+Check it against the pairwise function with:
+
+    python answer_similarity.py check --phrases phrases.txt
+"""
+
+import re
+import time
+import difflib
+import argparse
+from typing import List
+
+import numpy as np
+
+SIMILARITY_THRESHOLD = 0.8
+
+ABBREVIATIONS = {
+    'united states': 'us',
+    'united kingdom': 'uk',
+    'national aeronautics and space administration': 'nasa',
+    'federal bureau of investigation': 'fbi',
+}
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text for comparison by removing punctuation and standardizing spacing.
+    """
+    # Remove line breaks
+    text = text.replace('\n', ' ')
+    # Standardize spaces
+    text = ' '.join(text.split())
+    # Convert to lowercase
+    text = text.lower()
+    # Remove punctuation except apostrophes
+    text = re.sub(r'[^\w\s\']', '', text)
+    # Standardize abbreviations
+    text = text.replace('u.s.', 'us')
+    text = text.replace('u.k.', 'uk')
+    return text
+
+
+def _is_abbreviation(t1: str, t2: str) -> bool:
+    return ABBREVIATIONS.get(t1) == t2 or ABBREVIATIONS.get(t2) == t1
+
+
+def are_similar_answers(text1: str, text2: str) -> bool:
+    """
+    Check if two answers are similar or variants of each other.
+    """
+    t1 = normalize_text(text1)
+    t2 = normalize_text(text2)
+
+    # Direct match after normalization
+    if t1 == t2:
+        return True
+
+    # Check if one is abbreviation of other
+    if _is_abbreviation(t1, t2):
+        return True
+
+    # Check for high similarity using difflib
+    similarity = difflib.SequenceMatcher(None, t1, t2).ratio()
+    return similarity > SIMILARITY_THRESHOLD
+
+
+def _char_counts(texts: List[str], alphabet: dict) -> np.ndarray:
+    counts = np.zeros((len(texts), len(alphabet)), dtype=np.int32)
+    for i, text in enumerate(texts):
+        for char in text:
+            counts[i, alphabet[char]] += 1
+    return counts
+
+
+def similarity_mask(candidates: List[str], references: List[str]) -> np.ndarray:
+    """Boolean matrix with `[i, j] == are_similar_answers(candidates[i], references[j])`."""
+    mask = np.zeros((len(candidates), len(references)), dtype=bool)
+    if not candidates or not references:
+        return mask
+
+    cand = [normalize_text(text) for text in candidates]
+    refs = [normalize_text(text) for text in references]
+
+    # Upper bound on SequenceMatcher.ratio(): 2 * shared characters / total length
+    alphabet = {char: i for i, char in enumerate(sorted(set(''.join(cand + refs))))}
+    cand_counts = _char_counts(cand, alphabet)
+    ref_counts = _char_counts(refs, alphabet)
+    shared = np.minimum(cand_counts[:, None, :], ref_counts[None, :, :]).sum(axis=-1)
+    lengths = cand_counts.sum(axis=1)[:, None] + ref_counts.sum(axis=1)[None, :]
+    bound = np.where(lengths > 0, 2.0 * shared / np.maximum(lengths, 1), 1.0)
+
+    for i, j in zip(*np.nonzero(bound > SIMILARITY_THRESHOLD)):
+        t1, t2 = cand[i], refs[j]
+        mask[i, j] = t1 == t2 or difflib.SequenceMatcher(None, t1, t2).ratio() > SIMILARITY_THRESHOLD
+
+    # Exact and abbreviation matches can fall below the bound (e.g. "us" / "united states")
+    for i, t1 in enumerate(cand):
+        for j, t2 in enumerate(refs):
+            if not mask[i, j] and (t1 == t2 or _is_abbreviation(t1, t2)):
+                mask[i, j] = True
+    return mask
+
+
+def dedupe_candidates(candidates: List[str], references: List[str], limit: int = None) -> List[int]:
+    """Indices of candidates, in order, that aren't similar to a reference or an earlier kept candidate."""
+    mask = similarity_mask(candidates, list(references) + list(candidates))
+    against_refs = mask[:, :len(references)].any(axis=1)
+    kept = []
+    for i in range(len(candidates)):
+        if against_refs[i] or any(mask[i, len(references) + j] for j in kept):
+            continue
+        kept.append(i)
+        if limit is not None and len(kept) >= limit:
+            break
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check similarity_mask against are_similar_answers")
+    parser.add_argument('command', choices=['check'])
+    parser.add_argument('--phrases', type=str, required=True, help='Text file with one phrase per line')
+    parser.add_argument('--limit', type=int, default=300, help='Compare all pairs of the first N phrases')
+    args = parser.parse_args()
+
+    with open(args.phrases, "r", encoding="utf-8") as f:
+        phrases = [line.strip() for line in f if line.strip()][:args.limit]
+
+    start = time.perf_counter()
+    expected = np.array([[are_similar_answers(a, b) for b in phrases] for a in phrases], dtype=bool)
+    pairwise_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = similarity_mask(phrases, phrases)
+    batch_s = time.perf_counter() - start
+
+    mismatches = list(zip(*np.nonzero(expected != actual)))
+    print(f"{len(phrases) ** 2} pairs, {int(expected.sum())} similar, {len(mismatches)} mismatches")
+    print(f"pairwise: {pairwise_s * 1000:.1f} ms, batch: {batch_s * 1000:.1f} ms")
+    for i, j in mismatches[:20]:
+        print(f"  {phrases[i]!r} vs {phrases[j]!r}: expected {expected[i, j]}, got {actual[i, j]}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
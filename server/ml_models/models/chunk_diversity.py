@@ -0,0 +1,129 @@
+"""
+Topical spread of chunks and near-duplicate question suppression.
+
+Each chunk of a document is embedded once with the sentence model used for
+distractors (MiniLM), and the matrix is kept in the document's chunk store.
+`farthest_point_order` orders chunks so that each next one is the least similar
+to everything picked before it. Early chunks therefore cover different topics
+instead of several neighbouring paragraphs about the same thing. Only the first
+`limit` picks are spread this way (a run visits a bounded number of chunks),
+so ordering a long document costs O(limit * n) instead of O(n^2).
+
+`QuestionDeduper` drops questions whose embedding is within a cosine threshold of
+a question already produced in the same run, or served to the same game from the
+question bank. It runs before distractor generation, so paraphrased duplicates
+never cost a distractor lookup or an upload. Question embeddings are kept by the
+deduper itself, not in the distractor phrase cache.
+"""
+
+import random
+import logging
+import threading
+from typing import Callable, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUESTION_DUPLICATE_THRESHOLD = 0.9
+EMBEDDING_BATCH_SIZE = 64
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-8)
+
+
+def get_chunk_embeddings(store, model, model_name: str) -> np.ndarray:
+    """Row-normalised embeddings of every chunk in a chunk store, encoded (and saved) on first use."""
+    name = f"embeddings_{model_name}"
+    embeddings = store.get_array(name)
+    if embeddings is None or len(embeddings) != len(store):
+        texts = [store.text(i) for i in range(len(store))]
+        embeddings = normalize_rows(model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE)).astype(np.float16)
+        store.put_array(name, embeddings)
+        logger.info(f"Embedded {len(store)} chunks with {model_name}")
+    return normalize_rows(embeddings)
+
+
+def farthest_point_order(tiers: List[List[int]], embeddings: np.ndarray, rng: random.Random = None,
+                         limit: int = None) -> List[int]:
+    """Order each tier of chunk indices by farthest-point sampling, tier after tier.
+
+    The first chunk is random. Each next chunk is the one in the current tier
+    whose highest similarity to any chunk already ordered (in any tier) is lowest.
+    After `limit` chunks, the rest of each tier is shuffled instead.
+    """
+    rng = rng or random.Random()
+    order = []
+    # Highest similarity of every chunk to the chunks ordered so far
+    closest = np.full(len(embeddings), -np.inf, dtype=np.float32)
+    for tier in tiers:
+        remaining = np.array(tier, dtype=np.int64)
+        while len(remaining) and (limit is None or len(order) < limit):
+            if order:
+                pick = int(np.argmin(closest[remaining]))
+            else:
+                pick = rng.randrange(len(remaining))
+            chunk = int(remaining[pick])
+            order.append(chunk)
+            remaining = np.delete(remaining, pick)
+            closest = np.maximum(closest, embeddings @ embeddings[chunk])
+        rest = [int(i) for i in remaining]
+        rng.shuffle(rest)
+        order.extend(rest)
+    return order
+
+
+class QuestionDeduper:
+    """Questions produced so far in a run, for rejecting near-duplicates by cosine similarity."""
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], threshold: float = QUESTION_DUPLICATE_THRESHOLD):
+        self.encode = encode
+        self.threshold = threshold
+        self._seen = None
+        self._pending = {}  # Embeddings of questions that passed `filter`, until they are added
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return 0 if self._seen is None else len(self._seen)
+
+    def filter(self, questions: List[str]) -> List[int]:
+        """Indices of questions that aren't near-duplicates of a seen question or an earlier one here."""
+        if not questions:
+            return []
+        embeddings = normalize_rows(self.encode(questions))
+        with self._lock:
+            seen = self._seen
+        too_close = np.zeros(len(questions), dtype=bool)
+        if seen is not None:
+            too_close = (embeddings @ seen.T).max(axis=1) >= self.threshold
+        within = embeddings @ embeddings.T
+
+        kept = []
+        for i in range(len(questions)):
+            if too_close[i] or any(within[i, j] >= self.threshold for j in kept):
+                continue
+            kept.append(i)
+        with self._lock:
+            self._pending.update((questions[i], embeddings[i]) for i in kept)
+        return kept
+
+    def discard(self, questions: List[str]):
+        """Forget questions that passed `filter` but were rejected later."""
+        with self._lock:
+            for question in questions:
+                self._pending.pop(question, None)
+
+    def add(self, questions: List[str]):
+        """Remember questions that made it into the run (or were served before it)."""
+        if not questions:
+            return
+        with self._lock:
+            known = {question: self._pending.pop(question) for question in questions if question in self._pending}
+        missing = list(dict.fromkeys(question for question in questions if question not in known))
+        if missing:
+            known.update(zip(missing, normalize_rows(self.encode(missing))))
+        embeddings = np.array([known[question] for question in questions], dtype=np.float32)
+        with self._lock:
+            self._seen = embeddings if self._seen is None else np.vstack([self._seen, embeddings])
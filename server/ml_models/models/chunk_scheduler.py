@@ -0,0 +1,173 @@
+"""
+Adaptive chunk scheduling from per-chunk outcomes.
+
+Every question attempt ends either accepted or rejected for a reason (see
+`ChunkRejected`). `RegionScheduler` splits the document into contiguous regions
+and picks the next chunk by Thompson sampling: each region keeps a
+Beta(accepted + 1, rejected + 1) posterior of its yield, one sample is drawn per
+region and the best region gives up its next chunk. Within a region, chunks are
+taken in the order given (e.g. by chunk score). Regions that keep failing (an
+index, a table of contents, reference lists) are visited less and less.
+
+Outcomes arrive only after a chunk has passed through every pipeline stage, so
+with `max_in_flight` the scheduler stops handing out chunks while that many are
+still awaiting their first outcome. Later picks then use what the earlier
+chunks showed instead of being made blind.
+
+Once enough outcomes are in, the scheduler stops handing out chunks if even an
+optimistic estimate of the yield can't reach the requested number of
+questions within the chunk cap, instead of running the models on the rest.
+It never gives up before the cap while nothing has been accepted.
+"""
+
+import math
+import random
+import logging
+import threading
+from collections import Counter, deque
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rejection reasons
+CHUNK_TOO_SHORT = "chunk_too_short"
+INVALID_QUESTION = "invalid_question"
+LOW_CONFIDENCE = "low_confidence"
+NO_ANSWER = "no_answer"
+ANSWER_TOO_LONG = "answer_too_long"
+NO_DISTRACTORS = "no_distractors"
+DUPLICATE = "duplicate"
+ERROR = "error"
+
+NUM_REGIONS = 10
+MIN_OUTCOMES = 16  # Outcomes needed before giving up early
+STALL_TIMEOUT = 60.0  # Seconds to wait for outcomes before handing out a chunk anyway
+
+
+class ChunkRejected(ValueError):
+    """A chunk or question was rejected; `reason` is one of the reason codes above."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def rejection_reason(error: Exception) -> str:
+    return getattr(error, "reason", ERROR)
+
+
+class RegionScheduler:
+    """Thompson sampling over document regions, fed with per-chunk outcomes."""
+
+    def __init__(self, order: List[int], num_questions: int, max_chunks: int, num_regions: int = NUM_REGIONS,
+                 rng: random.Random = None, max_in_flight: int = None):
+        self.num_questions = num_questions
+        self.max_in_flight = max_in_flight
+        self.max_chunks = min(max_chunks, len(order))
+        self.rng = rng or random.Random()
+        num_chunks = max(order) + 1 if order else 0
+        self.regions = [deque() for _ in range(min(num_regions, max(num_chunks, 1)))]
+        for i in order:
+            self.regions[self.region(i, num_chunks)].append(i)
+        self._region_of = {i: self.region(i, num_chunks) for i in order}
+        self.accepted = [0] * len(self.regions)
+        self.rejected = [0] * len(self.regions)
+        self.reasons = Counter()
+        self.visited = 0
+        self.chunks_with_outcomes = set()
+        self.stopped_early = False
+        self.closed = False
+        self._lock = threading.Lock()
+        self._outcome = threading.Condition(self._lock)
+
+    def region(self, chunk_idx: int, num_chunks: int) -> int:
+        return chunk_idx * len(self.regions) // max(num_chunks, 1)
+
+    def record(self, chunk_idx: int, reason: Optional[str] = None):
+        """Record one question attempt from a chunk: accepted (no reason) or rejected with `reason`."""
+        region = self._region_of.get(chunk_idx)
+        if region is None:
+            return
+        with self._lock:
+            self.chunks_with_outcomes.add(chunk_idx)
+            if reason is None:
+                self.accepted[region] += 1
+            else:
+                self.rejected[region] += 1
+                self.reasons[reason] += 1
+            self._outcome.notify_all()
+
+    def close(self):
+        """Stop handing out chunks, releasing an iterator waiting for outcomes."""
+        with self._outcome:
+            self.closed = True
+            self._outcome.notify_all()
+
+    def in_flight(self) -> int:
+        """Chunks handed out that have no outcome yet (call with the lock held)."""
+        return self.visited - len(self.chunks_with_outcomes)
+
+    def wait_for_outcomes(self) -> bool:
+        """Block while `max_in_flight` chunks await outcomes. Returns False once closed."""
+        with self._outcome:
+            waited = 0.0
+            while not self.closed and self.max_in_flight and self.in_flight() >= self.max_in_flight:
+                if waited >= STALL_TIMEOUT:
+                    logger.warning(f"No chunk outcomes for {STALL_TIMEOUT:.0f}s, handing out the next chunk anyway")
+                    break
+                self._outcome.wait(timeout=0.5)
+                waited += 0.5
+            return not self.closed
+
+    def unreachable(self) -> bool:
+        """True if an optimistic yield estimate can't reach `num_questions` within the chunk cap.
+
+        Never true while nothing has been accepted: the estimate says little then,
+        and stopping would leave the game with no questions at all.
+        """
+        with self._lock:
+            accepted = sum(self.accepted)
+            outcomes = accepted + sum(self.rejected)
+            if outcomes < MIN_OUTCOMES or accepted == 0 or accepted >= self.num_questions:
+                return False
+            # Upper end of the yield per attempt, and attempts per chunk so far
+            p = (accepted + 1) / (outcomes + 2)
+            p_high = p + 2 * math.sqrt(p * (1 - p) / (outcomes + 2))
+            attempts_per_chunk = outcomes / len(self.chunks_with_outcomes)
+            # Chunks still in the pipeline count towards what can be reached
+            remaining_chunks = (self.max_chunks - self.visited) + self.in_flight()
+            return accepted + remaining_chunks * attempts_per_chunk * p_high < self.num_questions
+
+    def next_chunk(self) -> Optional[int]:
+        """Draw a region by Thompson sampling and take its next chunk."""
+        with self._lock:
+            draws = [(self.rng.betavariate(self.accepted[r] + 1, self.rejected[r] + 1), r)
+                     for r, chunks in enumerate(self.regions) if chunks]
+            if not draws:
+                return None
+            _, region = max(draws)
+            self.visited += 1
+            return self.regions[region].popleft()
+
+    def __iter__(self) -> Iterator[int]:
+        while self.visited < self.max_chunks:
+            if not self.wait_for_outcomes():
+                return
+            if self.unreachable():
+                self.stopped_early = True
+                logger.info(f"Stopping after {self.visited} chunks: {self.num_questions} questions are "
+                            f"out of reach within {self.max_chunks} chunks ({self.summary()})")
+                return
+            chunk_idx = self.next_chunk()
+            if chunk_idx is None:
+                return
+            yield chunk_idx
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "chunks_visited": self.visited,
+                "accepted": sum(self.accepted),
+                "rejected": dict(self.reasons),
+                "stopped_early": self.stopped_early
+            }
@@ -0,0 +1,110 @@
+"""
+Cheap chunk scoring before any model runs.
+
+Many chunks are only rejected after T5 and RoBERTa have run on them: the
+question is too short, the answer confidence is low, the answer is too long, or
+it has no Sense2Vec sense. This module scores every chunk of a document from a
+few text features, so generation visits the chunks most likely to yield a
+question first:
+
+    entity_density  capitalised words that don't start a sentence, per word
+    vocab_hits      share of content words with a Sense2Vec answer sense
+    digit_ratio     digits and date/time punctuation, as in the chunker's table filter
+    sentences       number of sentences
+
+Features are extracted once per document and kept in its chunk store. Scoring is
+a weighted sum of the per-document z-scores of all chunks at once. Chunks are
+visited tier by tier in score order, shuffled within each tier (or spread by
+topic, see chunk_diversity.py), so games on the same document still see
+different chunks.
+"""
+
+import re
+import random
+import logging
+from typing import Callable, Iterable, List
+
+import numpy as np
+
+from chunker import SENTENCE_END, digit_ratio
+from chunk_diversity import farthest_point_order
+from s2v_prune import ANSWER_SENSES
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ["entity_density", "vocab_hits", "digit_ratio", "sentences"]
+FEATURE_WEIGHTS = np.array([1.0, 1.0, -1.5, 0.5])
+NUM_TIERS = 4
+MIN_CONTENT_WORD_LENGTH = 4
+
+WORD = re.compile(r"[A-Za-z][A-Za-z'-]*")
+
+
+def sense_lookup(s2v, senses: List[str] = ANSWER_SENSES) -> Callable[[str], bool]:
+    """Memoized "does this word have an answer sense in Sense2Vec?" check."""
+    seen = {}
+
+    def has_sense(word: str) -> bool:
+        if word not in seen:
+            seen[word] = s2v.get_best_sense(word, senses=senses) is not None
+        return seen[word]
+
+    return has_sense
+
+
+def chunk_features(texts: Iterable[str], has_sense: Callable[[str], bool]) -> np.ndarray:
+    """(chunks, FEATURES) matrix of raw feature values."""
+    rows = []
+    for text in texts:
+        sentences = [sentence for sentence in SENTENCE_END.split(text) if sentence.strip()]
+        num_words = capitalised = 0
+        content_words = set()
+        for sentence in sentences:
+            words = WORD.findall(sentence)
+            num_words += len(words)
+            capitalised += sum(1 for word in words[1:] if word[0].isupper())
+            content_words.update(word.lower() for word in words if len(word) >= MIN_CONTENT_WORD_LENGTH)
+        hits = sum(1 for word in content_words if has_sense(word))
+        rows.append([capitalised / max(num_words, 1), hits / max(len(content_words), 1),
+                     digit_ratio(text), len(sentences)])
+    return np.array(rows, dtype=np.float32).reshape(-1, len(FEATURES))
+
+
+def score_chunks(features: np.ndarray) -> np.ndarray:
+    """Score every chunk by its weighted feature z-scores within the document."""
+    values = np.asarray(features, dtype=np.float64).copy()
+    sentences = FEATURES.index("sentences")
+    values[:, sentences] = np.log1p(values[:, sentences])
+    std = values.std(axis=0)
+    std[std == 0] = 1.0
+    return ((values - values.mean(axis=0)) / std) @ FEATURE_WEIGHTS
+
+
+def visit_order(scores: np.ndarray, rng: random.Random = None, num_tiers: int = NUM_TIERS,
+                embeddings: np.ndarray = None, spread_limit: int = None) -> List[int]:
+    """Chunk indices from the best-scoring tier to the worst.
+
+    Each tier is shuffled, or with chunk `embeddings` ordered by farthest-point
+    sampling so consecutive chunks cover different topics (for the first
+    `spread_limit` chunks only, if given).
+    """
+    rng = rng or random.Random()
+    tiers = [[int(i) for i in tier] for tier in np.array_split(np.argsort(-scores, kind="stable"), num_tiers)]
+    if embeddings is not None:
+        return farthest_point_order(tiers, embeddings, rng, limit=spread_limit)
+    order = []
+    for tier in tiers:
+        rng.shuffle(tier)
+        order.extend(tier)
+    return order
+
+
+def get_chunk_scores(store, s2v, s2v_name: str) -> np.ndarray:
+    """Scores of every chunk in a chunk store, extracting (and saving) the features on first use."""
+    name = f"features_{s2v_name}"
+    features = store.get_array(name)
+    if features is None or len(features) != len(store):
+        features = chunk_features((store.text(i) for i in range(len(store))), sense_lookup(s2v))
+        store.put_array(name, features)
+        logger.info(f"Extracted chunk features for {len(store)} chunks")
+    return score_chunks(features)
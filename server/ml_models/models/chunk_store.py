@@ -0,0 +1,193 @@
+"""
+Per-document chunk store with cached token ids.
+
+A document is chunked and tokenized once, and the result is kept on disk as
+memory-mapped `.npy` arrays, keyed by the document's content hash:
+
+    text.npy         uint8, UTF-8 bytes of all chunks back to back
+    text_offsets.npy int64, byte offset of each chunk in text.npy (n + 1 entries)
+    qg_ids.npy       int32, T5 token ids of all chunks (no special tokens)
+    qg_offsets.npy   int64, offset of each chunk's ids in qg_ids.npy (n + 1 entries)
+    qa_ids.npy       int32, RoBERTa token ids of all chunks (no special tokens)
+    qa_offsets.npy   int64, offset of each chunk's ids in qa_ids.npy (n + 1 entries)
+    qa_spans.npy     int32, (start, end) character span of each RoBERTa token in its chunk
+    meta.json        number of chunks and tokenizers
+
+Other per-chunk arrays (e.g. chunk scores) can be added to a saved store with
+`put_array`. Chunks are stored in document order. Later games on the same document read
+chunks and ids straight from the arrays and tokenize nothing. A store is
+written to a temporary directory and renamed into place, so concurrent workers
+never see a half-written store.
+
+Loading a store marks it as used. `evict` removes stores unused for longer
+than a TTL, then least recently used ones until the directory fits a size limit.
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ARRAYS = ["text", "text_offsets", "qg_ids", "qg_offsets", "qa_ids", "qa_offsets", "qa_spans"]
+
+
+def _offsets(rows: List) -> np.ndarray:
+    """Start offset of each row in the concatenation of `rows`, plus the total length."""
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    return offsets
+
+
+class ChunkStore:
+    """Chunks of one document and their T5 and RoBERTa token ids."""
+
+    def __init__(self, arrays: dict, meta: dict = None, path: str = None):
+        self._arrays = arrays
+        self.meta = meta or {}
+        self.path = path
+
+    def __len__(self) -> int:
+        return len(self._arrays["text_offsets"]) - 1
+
+    def _slice(self, name: str, i: int) -> np.ndarray:
+        offsets = self._arrays[f"{name.split('_')[0]}_offsets"]
+        return self._arrays[name][int(offsets[i]):int(offsets[i + 1])]
+
+    def text(self, i: int) -> str:
+        return bytes(self._slice("text", i)).decode('utf-8')
+
+    def qg_ids(self, i: int) -> np.ndarray:
+        return self._slice("qg_ids", i)
+
+    def qa_ids(self, i: int) -> np.ndarray:
+        return self._slice("qa_ids", i)
+
+    def qa_spans(self, i: int) -> np.ndarray:
+        return self._slice("qa_spans", i)
+
+    def get_array(self, name: str) -> Optional[np.ndarray]:
+        """An extra array saved with `put_array`, or None."""
+        if name not in self._arrays and self.path and os.path.exists(os.path.join(self.path, f"{name}.npy")):
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+        return self._arrays.get(name)
+
+    def put_array(self, name: str, array: np.ndarray):
+        """Keep an extra array with the store, saving it next to the others if the store is on disk."""
+        self._arrays[name] = array
+        if self.path:
+            tmp_file = os.path.join(self.path, f"{name}.tmp{os.getpid()}.npy")
+            np.save(tmp_file, array)
+            os.replace(tmp_file, os.path.join(self.path, f"{name}.npy"))
+
+    @classmethod
+    def build(cls, chunks: Iterable[str], qg_tokenizer, qa_tokenizer, batch_size: int = 256) -> "ChunkStore":
+        """Tokenize `chunks` for both models, in batches."""
+        texts = list(chunks)
+        qg_rows, qa_rows, span_rows = [], [], []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            qg_rows.extend(qg_tokenizer(batch, add_special_tokens=False)["input_ids"])
+            qa = qa_tokenizer(batch, add_special_tokens=False, return_offsets_mapping=True)
+            qa_rows.extend(qa["input_ids"])
+            span_rows.extend(qa["offset_mapping"])
+
+        encoded = [text.encode('utf-8') for text in texts]
+        arrays = {
+            "text": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "text_offsets": _offsets(encoded),
+            "qg_ids": np.fromiter((t for row in qg_rows for t in row), dtype=np.int32),
+            "qg_offsets": _offsets(qg_rows),
+            "qa_ids": np.fromiter((t for row in qa_rows for t in row), dtype=np.int32),
+            "qa_offsets": _offsets(qa_rows),
+            "qa_spans": np.array([span for row in span_rows for span in row], dtype=np.int32).reshape(-1, 2),
+        }
+        return cls(arrays, {
+            "num_chunks": len(texts),
+            "qg_tokenizer": getattr(qg_tokenizer, "name_or_path", None),
+            "qa_tokenizer": getattr(qa_tokenizer, "name_or_path", None),
+        })
+
+    def save(self, path: str) -> bool:
+        """Write the store to `path` atomically; returns False if another process got there first."""
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), self._arrays[name])
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({**self.meta, "built": time.time()}, f)
+        try:
+            os.rename(tmp_path, path)
+            return True
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return False
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkStore":
+        meta_path = os.path.join(path, "meta.json")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        try:
+            os.utime(meta_path)  # Mark as recently used
+        except OSError:
+            pass
+        return cls({name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in ARRAYS}, meta, path)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def evict(root: str, max_bytes: int, ttl: float = None, tmp_ttl: float = 3600):
+    """Delete stores under `root` unused for `ttl` seconds, then the least recently used until under `max_bytes`."""
+    if not os.path.isdir(root):
+        return
+    now = time.time()
+    stores = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        meta_path = os.path.join(path, "meta.json")
+        try:
+            if ".tmp" in name:
+                # Left behind by a build that died
+                if now - os.path.getmtime(path) > tmp_ttl:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.remove(path)
+                continue
+            used = os.path.getmtime(meta_path)
+        except OSError:
+            continue
+        if ttl is not None and now - used > ttl:
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        stores.append((used, _dir_size(path), path))
+
+    total = sum(size for _, size, _ in stores)
+    removed = 0
+    for _, size, path in sorted(stores):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        removed += 1
+    if removed:
+        logger.info(f"Evicted {removed} chunk stores from {root}")
@@ -0,0 +1,198 @@
+"""
+Streaming, tokenizer-aware document chunker.
+
+Reads a text file paragraph by paragraph without loading it whole, applies
+the same paragraph filters the generator always used, and packs sentences into
+chunks by their real token counts. Every chunk fits each given
+(tokenizer, max_tokens) budget, so the T5 prompt is never truncated and the
+QA context fits a single RoBERTa window. Sentences longer than a budget are cut
+at token boundaries, using the tokenizer's offset mapping.
+
+Chunks are yielded lazily, so generation can start while the rest of the
+document is still being read. `shuffle_buffer` randomises the order of a
+stream using a bounded buffer.
+
+The chunker runs on the generation pipeline's source thread while the model
+stages use the same tokenizers, so it must be given thread-safe ones (the
+models' tokenizers come wrapped in `LockedTokenizer`).
+"""
+
+import re
+import random
+import logging
+from typing import Iterable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIN_PARAGRAPH_LENGTH = 200
+# Paragraphs without blank lines for this long are flushed anyway, to bound memory
+MAX_PARAGRAPH_CHARS = 20000
+
+PAGE_ARTIFACT = re.compile(r'\d+\s+Science\s+\d+-\d+\s+Ch\d+\.qxd\s+\d+/\d+/\d+\s+\d+:\d+\s+Page\s+\d+')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def _read_paragraphs(f, stop_at: int = None) -> Iterator[str]:
+    """Paragraphs from a binary file object, up to byte offset `stop_at` (at a paragraph boundary)."""
+    lines = []
+    size = 0
+    while stop_at is None or f.tell() < stop_at:
+        raw = f.readline()
+        if not raw:
+            break
+        line = raw.decode('utf-8', errors='ignore')
+        if line.strip():
+            lines.append(line)
+            size += len(line)
+            if size < MAX_PARAGRAPH_CHARS:
+                continue
+        if lines:
+            yield "".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield "".join(lines)
+
+
+def iter_paragraphs(path: str, start_offset: int = 0) -> Iterator[str]:
+    """Blank-line separated paragraphs of a file, starting near byte `start_offset` and wrapping around."""
+    with open(path, "rb") as f:
+        start = 0
+        if start_offset > 0:
+            # Start at the first paragraph boundary after the offset
+            f.seek(start_offset)
+            f.readline()
+            while True:
+                start = f.tell()
+                raw = f.readline()
+                if not raw or not raw.strip():
+                    break
+            if not raw:
+                start = 0
+            f.seek(start)
+        yield from _read_paragraphs(f)
+        if start > 0:
+            f.seek(0)
+            yield from _read_paragraphs(f, stop_at=start)
+
+
+def digit_ratio(text: str) -> float:
+    """Share of characters that are digits or date/time punctuation."""
+    return sum(c.isdigit() or c in '/:.-' for c in text) / max(len(text), 1)
+
+
+def is_valid_paragraph(paragraph: str, min_paragraph_length: int = MIN_PARAGRAPH_LENGTH) -> bool:
+    """Skip short paragraphs, page numbers, headers and number-heavy tables."""
+    if len(paragraph) < min_paragraph_length:
+        return False
+    if re.match(r'^\d+$', paragraph) or re.match(r'^Chapter \d+', paragraph):
+        return False
+    return digit_ratio(paragraph) <= 0.3
+
+
+def _token_counts(texts: List[str], budgets: List[Tuple]) -> List[List[int]]:
+    """Token counts per text for each budget's tokenizer, counting the space that joins sentences."""
+    counts = []
+    for tokenizer, _ in budgets:
+        ids = tokenizer([f" {text}" for text in texts], add_special_tokens=False)["input_ids"]
+        counts.append([len(x) for x in ids])
+    return [list(c) for c in zip(*counts)]
+
+
+def _fits(counts: List[int], budgets: List[Tuple]) -> bool:
+    return all(count <= max_tokens for count, (_, max_tokens) in zip(counts, budgets))
+
+
+def _cut_point(text: str, budgets: List[Tuple], counts: List[int]) -> int:
+    """Character offset at which `text` runs out of the tightest budget it exceeds."""
+    cut = len(text)
+    for (tokenizer, max_tokens), count in zip(budgets, counts):
+        if count > max_tokens:
+            offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+            # One token of slack for the joining space counted in `_token_counts`
+            cut = min(cut, offsets[max_tokens - 2][1])
+    return cut
+
+
+def split_long_sentence(sentence: str, budgets: List[Tuple]) -> List[str]:
+    """Cut a sentence into pieces that fit every budget, at token boundaries."""
+    pieces = []
+    while sentence:
+        counts = _token_counts([sentence], budgets)[0]
+        if _fits(counts, budgets):
+            pieces.append(sentence)
+            break
+
+        cut = _cut_point(sentence, budgets, counts)
+        # Prefer to break on whitespace inside the allowed span
+        space = sentence.rfind(' ', 0, cut)
+        if space > cut // 2:
+            cut = space
+        piece = sentence[:cut].rstrip()
+
+        # Tokenizers can disagree at the cut, so re-check the piece against every budget
+        piece_counts = _token_counts([piece], budgets)[0]
+        while piece and not _fits(piece_counts, budgets):
+            piece = piece[:min(_cut_point(piece, budgets, piece_counts), len(piece) - 1)].rstrip()
+            piece_counts = _token_counts([piece], budgets)[0]
+        if not piece:
+            logger.warning(f"Dropping text that fits no token budget: {sentence[:100]}...")
+            break
+        pieces.append(piece)
+        sentence = sentence[len(piece):].strip()
+    return pieces
+
+
+def pack_paragraph(paragraph: str, budgets: List[Tuple], min_paragraph_length: int = MIN_PARAGRAPH_LENGTH) -> List[str]:
+    """Split a paragraph into chunks that fit every token budget."""
+    if _fits(_token_counts([paragraph], budgets)[0], budgets):
+        return [paragraph]
+
+    sentences = [s for s in SENTENCE_END.split(paragraph) if s.strip()]
+    chunks = []
+    current, current_counts = [], [0] * len(budgets)
+    for sentence, counts in zip(sentences, _token_counts(sentences, budgets)):
+        if not _fits(counts, budgets):
+            pieces = split_long_sentence(sentence, budgets)
+            # Never let a piece over any budget into a chunk
+            sentence_parts = [(piece, piece_counts) for piece, piece_counts in zip(pieces, _token_counts(pieces, budgets))
+                              if _fits(piece_counts, budgets)]
+        else:
+            sentence_parts = [(sentence, counts)]
+
+        for part, part_counts in sentence_parts:
+            combined = [a + b for a, b in zip(current_counts, part_counts)]
+            if current and not _fits(combined, budgets):
+                chunks.append(" ".join(current))
+                current, combined = [], part_counts
+            current.append(part)
+            current_counts = combined
+
+    # Like the character-based splitter, drop a short tail
+    if current and len(" ".join(current)) >= min_paragraph_length:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def iter_chunks(path: str, budgets: List[Tuple], min_paragraph_length: int = MIN_PARAGRAPH_LENGTH,
+                start_offset: int = 0) -> Iterator[str]:
+    """Lazily yield chunks of a text file that fit every (tokenizer, max_tokens) budget."""
+    for paragraph in iter_paragraphs(path, start_offset):
+        paragraph = PAGE_ARTIFACT.sub('', paragraph).strip()
+        if not is_valid_paragraph(paragraph, min_paragraph_length):
+            continue
+        yield from pack_paragraph(paragraph, budgets, min_paragraph_length)
+
+
+def shuffle_buffer(items: Iterable, buffer_size: int, rng: random.Random = None) -> Iterator:
+    """Yield items in a random order, holding at most `buffer_size` of them at a time."""
+    rng = rng or random.Random()
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
@@ -0,0 +1,164 @@
+"""
+Content-addressed, size-bounded disk cache with an optional S3 tier.
+
+Entries are JSON files named by the SHA-256 of their key parts. Reading an
+entry bumps its mtime, and once the cache grows past `max_bytes` the least
+recently used entries are deleted. If `s3_prefix` is set, local misses fall
+back to S3 and new entries are written through to it.
+
+With a `ttl` (seconds), values are stored with their write time and treated as
+misses once they are older than that. Hits, misses and expiries are counted
+per cache instance; see `stats()`.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import time
+import threading
+from typing import Any, Dict, Optional
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../data_preprocessing'))
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.getenv(
+    'QG_CACHE_DIR',
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'outputs', 'cache'))
+)
+
+
+def make_key(*parts) -> str:
+    """Hash any JSON-serialisable key parts into a cache key."""
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class DiskLRUCache:
+    """JSON value cache on local disk, evicting least recently used entries."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024, s3_prefix: Optional[str] = None,
+                 evict_every: int = 100, ttl: Optional[float] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.s3_prefix = s3_prefix
+        self.evict_every = evict_every
+        self.ttl = ttl
+        self._writes = 0
+        self._counts = {"hits": 0, "misses": 0, "expired": 0}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> Dict:
+        """Hit/miss/expiry counts since this instance was created, and the hit rate."""
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts["hits"] + counts["misses"]
+        return {**counts, "hit_rate": counts["hits"] / lookups if lookups else 0.0}
+
+    def _unwrap(self, key: str, stored: Any) -> Optional[Any]:
+        """The value inside a stored entry, or None if it has expired."""
+        if self.ttl is None:
+            return stored
+        if not isinstance(stored, dict) or time.time() - stored.get("created", 0) > self.ttl:
+            self._count("expired")
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            return None
+        return stored["value"]
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key`, or None on a miss."""
+        value = self._get(key)
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def _get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            os.utime(path)  # Mark as recently used
+            value = self._unwrap(key, stored)
+            if value is not None:
+                return value
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        if self.s3_prefix:
+            from s3_utils import read_json_from_s3
+            stored = read_json_from_s3(f"{self.s3_prefix}{key}.json")
+            if stored is not None:
+                value = self._unwrap(key, stored)
+                if value is not None:
+                    self._write_local(key, stored)
+                    return value
+        return None
+
+    def put(self, key: str, value: Any):
+        """Store `value` under `key` locally (and in S3 if configured)."""
+        stored = {"created": time.time(), "value": value} if self.ttl is not None else value
+        self._write_local(key, stored)
+        if self.s3_prefix:
+            from s3_utils import write_json_to_s3
+            write_json_to_s3(stored, f"{self.s3_prefix}{key}.json")
+
+    def _write_local(self, key: str, value: Any):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                continue
+        logger.info(f"Evicted {removed} cache entries from {self.cache_dir}")
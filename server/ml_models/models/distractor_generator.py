@@ -1,41 +1,101 @@
 import os
 from sense2vec import Sense2Vec
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import random
 import re
-import difflib
 import logging
+import threading
+import itertools
+from collections import OrderedDict
+from s2v_index import SubstringIndex, load_or_build, scan_keys
+from s2v_ann import IVFIndex, DEFAULT_NPROBE
+from s2v_store import CompactSense2Vec, S2V_PATH, S2V_COMPACT_PATH, active_s2v_path
+from answer_similarity import normalize_text, are_similar_answers, dedupe_candidates
+import phrase_embeddings
+from disk_cache import DiskLRUCache, make_key, DEFAULT_CACHE_DIR
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Load models
-s2v_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "s2v_old"))
+s2v_path = S2V_PATH
+SENTENCE_MODEL_NAME = 'all-MiniLM-L12-v2'
+
+# Compact memory-mapped copy of s2v_old, built with `python s2v_store.py convert`.
+# Preferred when present (and S2V_COMPACT isn't 0) so worker processes share its pages.
+# Indexes are built per vocabulary and stored next to whichever model is in use
+s2v_active_path = active_s2v_path()
+USE_COMPACT_STORE = s2v_active_path == S2V_COMPACT_PATH
+
+# Approximate most_similar index, built offline with `python s2v_ann.py build`.
+# Exact Sense2Vec search is used if it is missing or S2V_ANN=0.
+ANN_INDEX_PATH = f"{s2v_active_path}_ann"
+USE_ANN_INDEX = os.getenv('S2V_ANN', '1') != '0' and os.path.exists(os.path.join(ANN_INDEX_PATH, "meta.json"))
+ann_index = None
+_ann_index_lock = threading.Lock()
+
+# Identifies the models and logic behind create_multiple_choice, for cache keys
+S2V_NAME = os.path.basename(s2v_active_path)
+DISTRACTOR_MODEL_VERSION = f"{S2V_NAME}+{SENTENCE_MODEL_NAME}+v2"
+if USE_ANN_INDEX:
+    DISTRACTOR_MODEL_VERSION += f"+ivf{DEFAULT_NPROBE}"
 
-logger.info(f"Loading Sense2Vec model from: {s2v_path}")
 try:
-    if not os.path.exists(s2v_path):
-        raise FileNotFoundError(f"Sense2Vec model directory not found at {s2v_path}")
-    
-    required_files = ['cfg', 'freqs.json', 'strings.json', 'key2row', 'vectors']
-    missing_files = [f for f in required_files if not os.path.exists(os.path.join(s2v_path, f))]
-    if missing_files:
-        raise FileNotFoundError(f"Missing required Sense2Vec model files: {missing_files}")
-    
-    s2v = Sense2Vec().from_disk(s2v_path)
+    if USE_COMPACT_STORE:
+        logger.info(f"Loading compact Sense2Vec store from: {S2V_COMPACT_PATH}")
+        s2v = CompactSense2Vec.load(S2V_COMPACT_PATH)
+    else:
+        logger.info(f"Loading Sense2Vec model from: {s2v_path}")
+        if not os.path.exists(s2v_path):
+            raise FileNotFoundError(f"Sense2Vec model directory not found at {s2v_path}")
+        
+        required_files = ['cfg', 'freqs.json', 'strings.json', 'key2row', 'vectors']
+        missing_files = [f for f in required_files if not os.path.exists(os.path.join(s2v_path, f))]
+        if missing_files:
+            raise FileNotFoundError(f"Missing required Sense2Vec model files: {missing_files}")
+        
+        s2v = Sense2Vec().from_disk(s2v_path)
     logger.info(f"Successfully loaded Sense2Vec model with {len(s2v)} words")
-    logger.info(f"Sample words from vocab: {list(s2v.keys())[:10]}")
+    logger.info(f"Sample words from vocab: {list(itertools.islice(s2v.keys(), 10))}")
 except Exception as e:
     logger.error(f"Failed to load Sense2Vec model: {str(e)}")
     raise
 
+# Sentence embeddings of every key's display form, row-aligned with the compact store
+# (`python phrase_embeddings.py build`). Candidates missing from it are encoded online.
+phrase_embedding_table = None
+if USE_COMPACT_STORE and os.getenv('S2V_PHRASE_EMBEDDINGS', '1') != '0':
+    phrase_embedding_table = phrase_embeddings.load(s2v_active_path, len(s2v), SENTENCE_MODEL_NAME)
+    if phrase_embedding_table is not None:
+        logger.info(f"Using precomputed phrase embeddings from {s2v_active_path}")
+        DISTRACTOR_MODEL_VERSION += "+pe16"
+
+# Substring index over the vocabulary, loaded on first use or built in the background
+SUBSTRING_INDEX_PATH = f"{s2v_active_path}_substring_index"
+substring_index = None
+_substring_index_lock = threading.Lock()
+_substring_index_builder = None  # pid of the process building it; forked workers inherit it
+
+# Process-wide LRU of phrase embeddings, keyed by normalised phrase
+EMBEDDING_CACHE_SIZE = int(os.getenv('QG_EMBEDDING_CACHE_SIZE', '50000'))
+_embedding_cache = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+# Ranked distractor candidates per (sense, question category), shared across games.
+# Each question samples MMR candidates from the top of the pool for variety.
+DISTRACTOR_POOL_TTL = float(os.getenv('QG_DISTRACTOR_POOL_TTL', str(7 * 24 * 3600)))
+DISTRACTOR_POOL_SAMPLE = int(os.getenv('QG_DISTRACTOR_POOL_SAMPLE', '15'))
+MMR_CANDIDATES = 10
+pool_cache = None
+_pool_cache_lock = threading.Lock()
+
 logger.info("Loading sentence transformer model...")
 try:
-    model = SentenceTransformer('all-MiniLM-L12-v2')
+    model = SentenceTransformer(SENTENCE_MODEL_NAME)
     logger.info("Successfully loaded sentence transformer model")
 except Exception as e:
     logger.error(f"Failed to load sentence transformer model: {str(e)}")
@@ -129,72 +189,206 @@ def proper_title_case(text: str) -> str:
     
     return ' '.join(result)
 
-def normalize_text(text: str) -> str:
-    """
-    Normalize text for comparison by removing punctuation and standardizing spacing.
-    """
-    # Remove line breaks
-    text = text.replace('\n', ' ')
-    # Standardize spaces
-    text = ' '.join(text.split())
-    # Convert to lowercase
-    text = text.lower()
-    # Remove punctuation except apostrophes
-    text = re.sub(r'[^\w\s\']', '', text)
-    # Standardize abbreviations
-    text = text.replace('u.s.', 'us')
-    text = text.replace('u.k.', 'uk')
-    return text
-
-def are_similar_answers(text1: str, text2: str) -> bool:
-    """
-    Check if two answers are similar or variants of each other.
-    """
-    t1 = normalize_text(text1)
-    t2 = normalize_text(text2)
-    
-    # Direct match after normalization
-    if t1 == t2:
-        return True
-        
-    # Check for abbreviation variants
-    abbrev_dict = {
-        'united states': 'us',
-        'united kingdom': 'uk',
-        'national aeronautics and space administration': 'nasa',
-        'federal bureau of investigation': 'fbi',
-    }
-    
-    # Check if one is abbreviation of other
-    for full, abbrev in abbrev_dict.items():
-        if (t1 == full and t2 == abbrev) or (t2 == full and t1 == abbrev):
-            return True
-    
-    # Check for high similarity using difflib
-    similarity = difflib.SequenceMatcher(None, t1, t2).ratio()
-    return similarity > 0.8
+def question_category(question: str) -> str:
+    """The kind of answer a question asks for, as far as `is_answer_type_match` cares."""
+    question_lower = question.lower()
+    if "what country" in question_lower:
+        return "country"
+    elif "what continent" in question_lower or "which continent" in question_lower:
+        return "continent"
+    elif "what is the main ingredient" in question_lower:
+        return "ingredient"
+    elif "what movie" in question_lower:
+        return "movie"
+    return "general"
 
 def is_answer_type_match(question: str, answer: str) -> bool:
     """Check if the answer type matches the question type."""
-    question_lower = question.lower()
+    category = question_category(question)
     answer_lower = answer.lower()
     
     # Check for question-answer type consistency
-    if "what country" in question_lower:
+    if category == "country":
         return not any(word in answer_lower for word in ["movie", "food", "drink", "year"])
-    elif "what continent" in question_lower or "which continent" in question_lower:
+    elif category == "continent":
         continents = {"asia", "africa", "europe", "north america", "south america", "australia", "antarctica"}
         return answer_lower in continents
-    elif "what is the main ingredient" in question_lower:
+    elif category == "ingredient":
         return not any(word in answer_lower for word in ["movie", "country", "year", "person"])
-    elif "what movie" in question_lower:
+    elif category == "movie":
         return not any(word in answer_lower for word in ["country", "food", "ingredient"])
     
     return True
 
-def create_multiple_choice(question: str, correct_answer: str, context: str) -> Dict:
-    print(f"\n[DEBUG] Generating MCQ for question: {question}")
+def embedding_key(phrase: str) -> str:
+    # The MiniLM tokenizer is uncased, so case doesn't change the embedding
+    return ' '.join(phrase.split()).lower()
+
+def encode_phrases(phrases: List[str]) -> np.ndarray:
+    """Sentence embeddings for `phrases`, encoding only cache misses, in one batch."""
+    keys = [embedding_key(phrase) for phrase in phrases]
+    embeddings = {}
+    with _embedding_cache_lock:
+        for key in keys:
+            if key in _embedding_cache:
+                _embedding_cache.move_to_end(key)
+                embeddings[key] = _embedding_cache[key]
+
+    missing = list(dict.fromkeys(key for key in keys if key not in embeddings))
+    if missing:
+        encoded = model.encode(missing, batch_size=max(1, len(missing)))
+        with _embedding_cache_lock:
+            for key, embedding in zip(missing, encoded):
+                embeddings[key] = embedding
+                _embedding_cache[key] = embedding
+                _embedding_cache.move_to_end(key)
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+
+    return np.array([embeddings[key] for key in keys])
+
+def display_form(key: str) -> str:
+    """The phrase shown (and embedded) for a Sense2Vec key, e.g. "new_york|GPE" -> "New York"."""
+    return proper_title_case(clean_word(key.split("|")[0].replace("_", " ")))
+
+def embed_candidates(words: List[str], keys: List[Optional[str]]) -> np.ndarray:
+    """Embeddings for candidate `words` taken from Sense2Vec `keys` (None if not from one).
+
+    Rows come from the precomputed phrase table where possible; anything else
+    goes through `encode_phrases`.
+    """
+    if phrase_embedding_table is not None:
+        rows = [s2v.row(key) if key else -1 for key in keys]
+    else:
+        rows = [-1] * len(keys)
+    missing = [i for i, row in enumerate(rows) if row < 0]
+    if len(missing) == len(words):
+        return encode_phrases(words)
+
+    found = [i for i, row in enumerate(rows) if row >= 0]
+    embeddings = np.empty((len(words), phrase_embedding_table.shape[1]), dtype=np.float32)
+    embeddings[found] = phrase_embedding_table[[rows[i] for i in found]]
+    if missing:
+        embeddings[missing] = encode_phrases([words[i] for i in missing])
+    return embeddings
+
+def get_pool_cache() -> Optional[DiskLRUCache]:
+    """Disk cache of distractor candidate pools, or None if disabled with QG_DISTRACTOR_POOL_CACHE=0."""
+    global pool_cache
+    if os.getenv('QG_DISTRACTOR_POOL_CACHE', '1') == '0':
+        return None
+    with _pool_cache_lock:
+        if pool_cache is None:
+            pool_cache = DiskLRUCache(
+                os.path.join(DEFAULT_CACHE_DIR, "distractor_pools"),
+                max_bytes=int(os.getenv('QG_DISTRACTOR_POOL_MAX_BYTES', str(64 * 1024 * 1024))),
+                ttl=DISTRACTOR_POOL_TTL
+            )
+    return pool_cache
+
+def _build_substring_index():
+    global substring_index
+    try:
+        index = load_or_build(SUBSTRING_INDEX_PATH, s2v.keys)
+    except Exception as e:
+        logger.error(f"Failed to build substring index: {str(e)}")
+        return
+    with _substring_index_lock:
+        substring_index = index
+
+def get_substring_index() -> Optional[SubstringIndex]:
+    """The substring index over the Sense2Vec keys, or None until it is available.
+
+    A missing index is built once on a background thread (build it ahead of time
+    with `python s2v_index.py build`), so loading the models doesn't wait for it.
+    Forked workers load it from disk once the process that started the build has
+    saved it.
+    """
+    global substring_index, _substring_index_builder
+    with _substring_index_lock:
+        if substring_index is None and SubstringIndex.exists(SUBSTRING_INDEX_PATH):
+            logger.info(f"Loading Sense2Vec substring index from {SUBSTRING_INDEX_PATH}")
+            substring_index = SubstringIndex.load(SUBSTRING_INDEX_PATH)
+        if substring_index is None and _substring_index_builder is None:
+            _substring_index_builder = os.getpid()
+            threading.Thread(target=_build_substring_index, name="substring-index-build", daemon=True).start()
+        return substring_index
+
+def get_ann_index() -> Optional[IVFIndex]:
+    """Load the approximate most_similar index on first use, if one has been built."""
+    global ann_index
+    if not USE_ANN_INDEX:
+        return None
+    with _ann_index_lock:
+        if ann_index is None:
+            logger.info(f"Loading Sense2Vec ANN index from {ANN_INDEX_PATH}")
+            ann_index = IVFIndex.load(ANN_INDEX_PATH)
+    return ann_index
+
+def most_similar(sense: str, n: int = 30) -> List[tuple]:
+    """Drop-in for `s2v.most_similar(sense, n)`, served from the ANN index when available."""
+    index = get_ann_index()
+    if index is not None and sense in index:
+        return index.most_similar(sense, n)
+    return s2v.most_similar(sense, n=n)
+
+def most_similar_batch(senses: List[str], n: int = 30) -> List[List[tuple]]:
+    """`most_similar` for several senses, with one matrix product over the table for exact search."""
+    if not senses:
+        return []
+    if get_ann_index() is not None:
+        # IVF probes only touch a few lists per query already
+        return [most_similar(sense, n) for sense in senses]
+    if isinstance(s2v, CompactSense2Vec):
+        return s2v.most_similar_batch(senses, n)
+
+    vectors = np.vstack([s2v[sense] for sense in senses])
+    keys, _, scores = s2v.vectors.most_similar(vectors, n=n + 1)
+    results = []
+    for sense, row_keys, row_scores in zip(senses, keys, scores):
+        similar = [(s2v.strings[int(key)], float(score)) for key, score in zip(row_keys, row_scores) if key]
+        results.append([(key, score) for key, score in similar if key != sense][:n])
+    return results
+
+def find_sense(correct_answer: str) -> Optional[str]:
+    """Find the Sense2Vec key (e.g. "nitrogen|NOUN") that best represents an answer."""
+    # First try with the original answer
+    lookup_variations = [
+        clean_answer_for_lookup(correct_answer),
+        correct_answer.lower().replace(" ", "_"),
+        correct_answer.lower(),
+    ]
     
+    # If no sense found, try with a simplified version
+    if not any(lookup_word in s2v for lookup_word in lookup_variations):
+        # Try to extract key terms from the answer
+        key_terms = [word for word in correct_answer.split() if len(word) > 3]
+        if key_terms:
+            lookup_variations.extend([
+                clean_answer_for_lookup(term) for term in key_terms
+            ])
+    
+    for lookup_word in lookup_variations:
+        print(f"[DEBUG] Trying lookup word: {lookup_word}")
+        if lookup_word in s2v:
+            sense = s2v.get_best_sense(lookup_word)
+            print(f"[DEBUG] Found direct match: {sense}")
+            return sense
+
+        # Find the best similar word in the vocabulary, sorted by simplicity and relevance
+        index = get_substring_index()
+        if index is not None:
+            similar_words = index.search(lookup_word, limit=1)
+        else:
+            similar_words = scan_keys(s2v.keys(), lookup_word, limit=1)
+        if similar_words:
+            print(f"[DEBUG] Found best similar word in vocab: {similar_words[0]}")
+            return similar_words[0]
+
+    return None
+
+def clean_question_and_answer(question: str, correct_answer: str) -> Tuple[str, str, str]:
+    """Returns (question, title-cased answer, original answer) as shown in the game."""
     # Add question mark if missing
     if not question.strip().endswith('?'):
         question = question.strip() + '?'
@@ -204,117 +398,142 @@ def create_multiple_choice(question: str, correct_answer: str, context: str) ->
     correct_answer = re.sub(r'\s*Question.*$', '', correct_answer).strip()
     original_answer = correct_answer  # Store original for case-insensitive comparison
     correct_answer = proper_title_case(correct_answer)
-    print(f"[DEBUG] Cleaned correct answer: {correct_answer}")
+    return question, correct_answer, original_answer
+
+def build_candidate_pool(question: str, sense: str, similar_senses: List[tuple]) -> List[List[str]]:
+    """Ranked [word, key] distractor candidates for a sense, independent of the exact answer text."""
+    # Get the semantic type of the correct answer
+    answer_type = sense.split('|')[1]
+    
+    pool = []
+    for each_word in similar_senses:
+        word_type = each_word[0].split("|")[1]
+        if word_type != answer_type:  # Different semantic type
+            continue
+        word = display_form(each_word[0])
+        if is_answer_type_match(question, word):
+            pool.append([word, each_word[0]])
+    return pool
+
+def sample_candidates(pool: List[List[str]], correct_answer: str) -> Tuple[List[str], List[str]]:
+    """Pick the MMR candidates (words and their keys) for one question from a ranked pool."""
+    # Drop near-duplicates of the answer and of each other in one batch
+    kept = dedupe_candidates([word for word, _ in pool], [correct_answer], limit=DISTRACTOR_POOL_SAMPLE)
+    if len(kept) > MMR_CANDIDATES:
+        kept = sorted(random.sample(kept, MMR_CANDIDATES))
+    return [pool[i][0] for i in kept], [pool[i][1] for i in kept]
+
+def get_candidate_pools(pending: List[Tuple[str, str]]) -> List[List[List[str]]]:
+    """Candidate pools for (question, sense) pairs, from the pool cache or one batched neighbour search."""
+    cache = get_pool_cache()
+    keys = [make_key("distractor_pool", sense, question_category(question), DISTRACTOR_MODEL_VERSION)
+            for question, sense in pending]
+    pools = [cache.get(key) if cache else None for key in keys]
+    misses = [j for j, pool in enumerate(pools) if pool is None]
+
+    if misses:
+        neighbours = most_similar_batch([pending[j][1] for j in misses], n=30)
+        for j, similar_senses in zip(misses, neighbours):
+            question, sense = pending[j]
+            pools[j] = build_candidate_pool(question, sense, similar_senses)
+            if cache:
+                cache.put(keys[j], pools[j])
+
+    if cache:
+        stats = cache.stats()
+        logger.info(f"Distractor pool cache: {len(pending) - len(misses)}/{len(pending)} hits, "
+                    f"{stats['hit_rate']:.1%} overall ({stats['expired']} expired)")
+    return pools
+
+def multiple_choice_error(question: str, correct_answer: str, context: str, error: Exception) -> ValueError:
+    logger.error(f"Failed to generate multiple choice question: {str(error)}")
+    logger.error(f"Question: {question}")
+    logger.error(f"Answer: {correct_answer}")
+    logger.error(f"Context: {context}")
+    return ValueError(f"Failed to generate multiple choice question: {str(error)}")
+
+def create_multiple_choice_batch(items: List[Tuple[str, str, str]]) -> List[Union[Dict, ValueError]]:
+    """`create_multiple_choice` for many (question, answer, context) triples at once.
+
+    Candidate pools come from the pool cache or one batched neighbour search,
+    candidates and answers are embedded together, and only MMR runs per
+    question. Returns one result per
+    triple: the question dict, or the ValueError `create_multiple_choice` would raise.
+    """
+    results = [None] * len(items)
+    pending = []
+    for i, (question, correct_answer, context) in enumerate(items):
+        print(f"\n[DEBUG] Generating MCQ for question: {question}")
+        question, correct_answer, original_answer = clean_question_and_answer(question, correct_answer)
+        print(f"[DEBUG] Cleaned correct answer: {correct_answer}")
+        try:
+            sense = find_sense(correct_answer)
+            if not sense:
+                raise ValueError(f"Could not find sense for answer: {correct_answer}")
+            pending.append((i, question, correct_answer, original_answer, sense))
+        except Exception as e:
+            results[i] = multiple_choice_error(question, correct_answer, context, e)
 
     try:
-        # First try with the original answer
-        lookup_variations = [
-            clean_answer_for_lookup(correct_answer),
-            correct_answer.lower().replace(" ", "_"),
-            correct_answer.lower(),
-        ]
-        
-        # If no sense found, try with a simplified version
-        if not any(lookup_word in s2v for lookup_word in lookup_variations):
-            # Try to extract key terms from the answer
-            key_terms = [word for word in correct_answer.split() if len(word) > 3]
-            if key_terms:
-                lookup_variations.extend([
-                    clean_answer_for_lookup(term) for term in key_terms
-                ])
-        
-        sense = None
-        for lookup_word in lookup_variations:
-            print(f"[DEBUG] Trying lookup word: {lookup_word}")
-            if lookup_word in s2v:
-                sense = s2v.get_best_sense(lookup_word)
-                print(f"[DEBUG] Found direct match: {sense}")
-                break
-            else:
-                # Find all similar words in vocabulary
-                similar_words = [word for word in s2v.keys() if lookup_word in word.lower()]
-                if similar_words:
-                    # Sort by simplicity and relevance
-                    similar_words.sort(key=lambda x: (
-                        len(x.split('_')),
-                        0 if x.split('|')[1] in ['NOUN', 'PERSON', 'GPE', 'LOC'] else 1,
-                        1 if any(term in x.lower() for term in ['movie', 'show', 'express', 'film']) else 0,
-                        0 if x.split('|')[0].lower() == lookup_word else 1
-                    ))
-                    
-                    sense = similar_words[0]
-                    print(f"[DEBUG] Found best similar word in vocab: {sense}")
-                    break
-        
-        if not sense:
-            raise ValueError(f"Could not find sense for answer: {correct_answer}")
-            
-        most_similar = s2v.most_similar(sense, n=30)
-        distractors = []
-        
-        # Get the semantic type of the correct answer
-        answer_type = sense.split('|')[1]
-        
-        # Use MMR to get diverse but relevant distractors
-        word_embeddings = []
-        words = []
-        
-        for each_word in most_similar:
-            word = clean_word(each_word[0].split("|")[0].replace("_", " "))
-            word_type = each_word[0].split("|")[1]
-            
-            # Apply proper title case
-            word = proper_title_case(word)
-            
-            # Basic filtering before embedding
-            if (are_similar_answers(word, correct_answer) or  # Similar to correct answer
-                any(are_similar_answers(word, d) for d in distractors) or  # Similar to existing
-                word_type != answer_type or  # Different semantic type
-                not is_answer_type_match(question, word)):  # Doesn't match question type
-                continue
-            
-            # Get word embedding
-            try:
-                word_embedding = model.encode([word])[0]
-                word_embeddings.append(word_embedding)
-                words.append(word)
-            except Exception as e:
-                print(f"[DEBUG] Error encoding word {word}: {str(e)}")
-                continue
-            
-            if len(words) >= 10:  # Get enough candidates for MMR
-                break
-        
+        pools = get_candidate_pools([(question, sense) for _, question, _, _, sense in pending])
+    except Exception as e:
+        for i, question, correct_answer, _, _ in pending:
+            results[i] = multiple_choice_error(question, correct_answer, items[i][2], e)
+        return results
+
+    # Sample candidates for every question, then embed them all at once
+    selected = []
+    for (i, question, correct_answer, original_answer, sense), pool in zip(pending, pools):
+        words, word_keys = sample_candidates(pool, correct_answer)
         if not words:
-            raise ValueError(f"Could not generate word embeddings for answer: {correct_answer}")
-            
-        # Convert to numpy arrays
-        word_embeddings = np.array(word_embeddings)
-        doc_embedding = model.encode([correct_answer])[0].reshape(1, -1)
-        
-        # Use MMR to select diverse distractors
-        selected_distractors = mmr(doc_embedding, word_embeddings, words, top_n=3, diversity=0.9)
-        distractors.extend(selected_distractors)
-        
-        if len(distractors) < 3:
-            raise ValueError(f"Could not generate enough distractors for answer: {correct_answer}")
-            
-        options = [correct_answer] + distractors[:3]
-        random.shuffle(options)
-        return {
-            "question": question,
-            "options": options,
-            "answer": correct_answer,
-            "case_insensitive_answer": original_answer,
-            "correct_answer": original_answer
-        }
+            error = ValueError(f"Could not generate word embeddings for answer: {correct_answer}")
+            results[i] = multiple_choice_error(question, correct_answer, items[i][2], error)
+            continue
+        selected.append((i, question, correct_answer, original_answer, sense, words, word_keys))
 
+    # The answer is usually its sense's display form, so it can come from the table too
+    phrases, keys = [], []
+    for *_, correct_answer, _, sense, words, word_keys in selected:
+        answer_key = sense if embedding_key(display_form(sense)) == embedding_key(correct_answer) else None
+        phrases.extend(words + [correct_answer])
+        keys.extend(word_keys + [answer_key])
+    try:
+        embeddings = embed_candidates(phrases, keys) if phrases else None
     except Exception as e:
-        logger.error(f"Failed to generate multiple choice question: {str(e)}")
-        logger.error(f"Question: {question}")
-        logger.error(f"Answer: {correct_answer}")
-        logger.error(f"Context: {context}")
-        raise ValueError(f"Failed to generate multiple choice question: {str(e)}")
+        for i, question, correct_answer, *_ in selected:
+            results[i] = multiple_choice_error(question, correct_answer, items[i][2], e)
+        return results
+
+    offset = 0
+    for i, question, correct_answer, original_answer, sense, words, word_keys in selected:
+        word_embeddings = embeddings[offset:offset + len(words)]
+        doc_embedding = embeddings[offset + len(words)].reshape(1, -1)
+        offset += len(words) + 1
+        try:
+            # Use MMR to select diverse distractors
+            distractors = mmr(doc_embedding, word_embeddings, words, top_n=3, diversity=0.9)
+            if len(distractors) < 3:
+                raise ValueError(f"Could not generate enough distractors for answer: {correct_answer}")
+                
+            options = [correct_answer] + distractors[:3]
+            random.shuffle(options)
+            results[i] = {
+                "question": question,
+                "options": options,
+                "answer": correct_answer,
+                "case_insensitive_answer": original_answer,
+                "correct_answer": original_answer
+            }
+        except Exception as e:
+            results[i] = multiple_choice_error(question, correct_answer, items[i][2], e)
+
+    return results
+
+def create_multiple_choice(question: str, correct_answer: str, context: str) -> Dict:
+    result = create_multiple_choice_batch([(question, correct_answer, context)])[0]
+    if isinstance(result, ValueError):
+        raise result
+    return result
 
 def are_variants(word1: str, word2: str) -> bool:
     """Check if two words are variants of each other (abbreviations, state names, etc.)"""
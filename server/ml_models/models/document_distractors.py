@@ -0,0 +1,150 @@
+"""
+In-document distractor fallback.
+
+When Sense2Vec has no sense for an answer (or too few usable neighbours),
+`create_multiple_choice` fails and the question is dropped after it has already
+paid for the T5 and QA passes. This module instead draws distractors from the
+document itself, like `DistractorGenerator.generate_simple_distractors` in
+../distractor_generator.py. It differs in three ways:
+
+- Entities and noun chunks from every chunk visited so far are embedded once,
+  in batches, into a per-document phrase table. Visited chunks are only queued
+  (`queue_texts`); they are parsed and embedded the first time a fallback is needed.
+- All failed answers of a batch are scored against the table with one matrix
+  product.
+- Candidates close to the answer (but not near-duplicates of it) are picked,
+  using the same MMR as the Sense2Vec path.
+"""
+
+import random
+import logging
+import threading
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from distractor_generator import encode_phrases, embedding_key, mmr, clean_question_and_answer, proper_title_case
+from answer_first import get_nlp, strip_leading_words
+from answer_similarity import dedupe_candidates
+
+logger = logging.getLogger(__name__)
+
+MAX_PHRASE_WORDS = 4
+MMR_CANDIDATES = 10
+
+
+class DocumentPhraseTable:
+    """Embeddings of the entities and noun phrases found in one document so far."""
+
+    def __init__(self):
+        self.phrases = []
+        self.labels = []
+        self._rows = {}
+        self._embeddings = []
+        self._matrix = None
+        self._seen_texts = set()
+        self._queued_texts = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def queue_texts(self, texts: List[str]):
+        """Remember texts to add on the next `add_texts` call, without parsing them now."""
+        with self._lock:
+            self._queued_texts.extend(texts)
+
+    def add_texts(self, texts: List[str]):
+        """Extract phrases from new (and queued) texts and embed the unseen ones in one batch."""
+        with self._lock:
+            texts = self._queued_texts + list(texts)
+            self._queued_texts = []
+        texts = [text for text in dict.fromkeys(texts) if text not in self._seen_texts]
+        if not texts:
+            return
+
+        new_phrases, new_labels = [], []
+        new_keys = set()
+        for doc in get_nlp().pipe(texts):
+            for span, label in [(ent, ent.label_) for ent in doc.ents] + [(chunk, "NP") for chunk in doc.noun_chunks]:
+                phrase, _ = strip_leading_words(span.text.strip(), span.start_char)
+                if not phrase or len(phrase.split()) > MAX_PHRASE_WORDS or not any(c.isalpha() for c in phrase):
+                    continue
+                key = embedding_key(phrase)
+                if key in self._rows or key in new_keys:
+                    continue
+                new_keys.add(key)
+                new_phrases.append(proper_title_case(' '.join(phrase.split())))
+                new_labels.append(label)
+
+        with self._lock:
+            self._seen_texts.update(texts)
+            if not new_phrases:
+                return
+            embeddings = encode_phrases(new_phrases)
+            for phrase, label, embedding in zip(new_phrases, new_labels, embeddings):
+                self._rows[embedding_key(phrase)] = len(self.phrases)
+                self.phrases.append(phrase)
+                self.labels.append(label)
+                self._embeddings.append(embedding)
+            self._matrix = None
+        logger.info(f"Document phrase table has {len(self.phrases)} phrases")
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Row-normalised embedding matrix, rebuilt after additions."""
+        with self._lock:
+            if self._matrix is None and self._embeddings:
+                matrix = np.asarray(self._embeddings, dtype=np.float32)
+                self._matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-8)
+            return self._matrix
+
+    def candidates(self, answer: str, similarities: np.ndarray) -> Tuple[List[str], List[int]]:
+        """MMR candidates for `answer`: the most similar phrases that aren't variants of it."""
+        order = np.argsort(-similarities)
+        # Prefer phrases with the same entity label as the answer when there are enough
+        label = self.labels[self._rows[embedding_key(answer)]] if embedding_key(answer) in self._rows else None
+        if label is not None:
+            same_label = [i for i in order if self.labels[i] == label]
+            if len(same_label) >= 3:
+                order = same_label
+
+        answer_lower = answer.lower()
+        order = [int(i) for i in order
+                 if self.phrases[i].lower() not in answer_lower and answer_lower not in self.phrases[i].lower()]
+        kept = dedupe_candidates([self.phrases[i] for i in order[:MMR_CANDIDATES * 3]], [answer],
+                                 limit=MMR_CANDIDATES)
+        rows = [order[i] for i in kept]
+        return [self.phrases[i] for i in rows], rows
+
+    def create_multiple_choice_batch(self, items: List[Tuple[str, str, str]]) -> List[Union[Dict, ValueError]]:
+        """Multiple choice questions with distractors from the document, for (question, answer, context) triples."""
+        self.add_texts([context for _, _, context in items])
+        matrix = self.matrix
+        if matrix is None or not items:
+            return [ValueError("No document phrases to draw distractors from") for _ in items]
+
+        cleaned = [clean_question_and_answer(question, answer) for question, answer, _ in items]
+        answer_embeddings = encode_phrases([answer for _, answer, _ in cleaned]).astype(np.float32)
+        answer_embeddings /= np.maximum(np.linalg.norm(answer_embeddings, axis=1, keepdims=True), 1e-8)
+        similarities = answer_embeddings @ matrix.T
+
+        results = []
+        for (question, correct_answer, original_answer), answer_embedding, row_similarities in zip(
+                cleaned, answer_embeddings, similarities):
+            words, rows = self.candidates(correct_answer, row_similarities)
+            if len(words) < 3:
+                results.append(ValueError(f"Not enough document distractors for answer: {correct_answer}"))
+                continue
+
+            distractors = mmr(answer_embedding.reshape(1, -1), matrix[rows], words, top_n=3, diversity=0.9)
+            options = [correct_answer] + distractors[:3]
+            random.shuffle(options)
+            results.append({
+                "question": question,
+                "options": options,
+                "answer": correct_answer,
+                "case_insensitive_answer": original_answer,
+                "correct_answer": original_answer
+            })
+        return results
@@ -0,0 +1,393 @@
+"""
+Resident question generation worker.
+
+Loads the T5, RoBERTa, Sense2Vec and SentenceTransformer models once and then
+serves generation jobs over a local Unix socket using a JSON-lines protocol.
+Each connection sends one job, and up to --concurrency jobs run at once on
+the shared models (tokenizer calls are serialized, see locked_tokenizer.py):
+
+    {"game_code": "ABC123", "num_questions": 10, "source_key": "outputs/ABC123/combined_output.txt"}
+
+and receives one reply, e.g. {"ok": true, "questions_generated": 10}.
+
+With --workers N the parent loads the models and then forks N workers that
+share the weight pages copy-on-write and accept jobs from the same socket.
+A pool worker runs one job at a time and only accepts a connection when it is
+idle. Each worker can be limited to --threads torch threads and pinned to its own
+CPU cores with --cpu_affinity.
+
+Without --serve this file is a thin client taking the same arguments as
+t5_model.py. It forwards the job to the worker and falls back to generating
+in-process (cold start) when no worker is listening.
+"""
+
+import os
+import sys
+import json
+import socket
+import socketserver
+import argparse
+import logging
+import gc
+import signal
+import time
+import threading
+import queue
+import multiprocessing
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = os.getenv('QG_WORKER_SOCKET', '/tmp/quizclash_qg.sock')
+DEFAULT_CONCURRENCY = int(os.getenv('QG_WORKER_CONCURRENCY', '2'))
+
+# Games running in this process; question bank top-ups yield to them
+_running_jobs = 0
+_running_jobs_lock = threading.Lock()
+# Games running in each pool worker, in shared memory so a top-up also yields to
+# games in sibling workers; set up by serve_pool before forking
+_pool_running_jobs = None
+_worker_index = 0
+# Top-ups run one at a time on a background thread, started lazily (after any fork)
+_top_up_queue = queue.Queue()
+_top_up_pending = set()
+_top_up_lock = threading.Lock()
+_top_up_thread = None
+
+
+def run_job(job: dict) -> dict:
+    """Run a single generation job using the already loaded models."""
+    import t5_model
+
+    if job.get('type') == 'ping':
+        import distractor_generator
+        pool_cache = distractor_generator.get_pool_cache()
+        return {"ok": True, "distractor_pool_cache": pool_cache.stats() if pool_cache else None}
+
+    game_code = job.get('game_code')
+    num_questions = job.get('num_questions')
+    if not game_code or not isinstance(num_questions, int) or num_questions < 1:
+        raise ValueError(f"Invalid job: {job}")
+
+    global _running_jobs
+    with _running_jobs_lock:
+        _running_jobs += 1
+        if _pool_running_jobs is not None:
+            _pool_running_jobs[_worker_index] = _running_jobs
+    try:
+        qa_pairs = t5_model.run_generation(
+            game_code,
+            num_questions,
+            batch_size=job.get('batch_size', 8),
+            source_key=job.get('source_key'),
+            answer_first=job.get('answer_first', False)
+        )
+    finally:
+        with _running_jobs_lock:
+            _running_jobs -= 1
+            if _pool_running_jobs is not None:
+                _pool_running_jobs[_worker_index] = _running_jobs
+    if qa_pairs is None:
+        return {"ok": True, "cancelled": True, "questions_generated": 0}
+    return {"ok": True, "questions_generated": len(qa_pairs)}
+
+
+def no_jobs_running() -> bool:
+    """True if no game is running in this process or, in a pool, in any worker."""
+    if _pool_running_jobs is not None:
+        return not any(_pool_running_jobs)
+    with _running_jobs_lock:
+        return _running_jobs == 0
+
+
+def top_up_after_job(job: dict):
+    """Refill the document's question bank, giving way as soon as a game job starts."""
+    import t5_model
+
+    source_key = job.get('source_key') or f"outputs/{job['game_code']}/combined_output.txt"
+    try:
+        t5_model.top_up_question_bank(
+            source_key,
+            job['num_questions'],
+            batch_size=job.get('batch_size', 8),
+            answer_first=job.get('answer_first', False),
+            is_active=no_jobs_running
+        )
+    except Exception as e:
+        logger.error(f"Question bank top-up failed: {str(e)}")
+    finally:
+        with _top_up_lock:
+            _top_up_pending.discard(source_key)
+
+
+def _top_up_loop():
+    while True:
+        job = _top_up_queue.get()
+        # Let queued games go first
+        while not no_jobs_running():
+            time.sleep(1)
+        top_up_after_job(job)
+
+
+def schedule_top_up(job: dict):
+    """Queue a question bank top-up for the job's document on the background thread."""
+    global _top_up_thread
+    if os.getenv('QG_QUESTION_BANK', '1') == '0':
+        return
+    source_key = job.get('source_key') or f"outputs/{job['game_code']}/combined_output.txt"
+    with _top_up_lock:
+        if source_key in _top_up_pending:
+            return
+        _top_up_pending.add(source_key)
+        if _top_up_thread is None:
+            _top_up_thread = threading.Thread(target=_top_up_loop, name="question-bank-top-up", daemon=True)
+            _top_up_thread.start()
+    _top_up_queue.put(job)
+
+
+class GenerationJobHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON job from the connection and writes one JSON reply."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            job = json.loads(line)
+            logger.info(f"Received job: {job}")
+            response = run_job(job)
+        except Exception as e:
+            logger.error(f"Job failed: {str(e)}")
+            response = {"ok": False, "error": str(e)}
+        self.wfile.write((json.dumps(response) + "\n").encode('utf-8'))
+
+        # The client has its reply; refill the question bank in the background
+        if response.get('ok') and not response.get('cancelled') and 'game_code' in job:
+            schedule_top_up(job)
+
+
+class BoundedThreadingUnixStreamServer(socketserver.ThreadingUnixStreamServer):
+    """Handles each connection in its own thread, with at most `max_concurrent` at a time.
+
+    Once the limit is reached the accept loop waits for a slot, so further
+    clients queue in the socket backlog instead of starting more threads.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, handler, max_concurrent: int = DEFAULT_CONCURRENCY):
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        super().__init__(socket_path, handler)
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+
+def create_server(socket_path: str, max_concurrent: int = DEFAULT_CONCURRENCY) -> socketserver.UnixStreamServer:
+    """Bind the worker socket, replacing a stale socket file left by a dead worker.
+
+    With `max_concurrent` None, jobs run one at a time in the accept loop itself,
+    so the server doesn't accept another connection until the job is done.
+    """
+    if os.path.exists(socket_path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                probe.connect(socket_path)
+            raise RuntimeError(f"A worker is already listening on {socket_path}")
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(socket_path)
+    if max_concurrent is None:
+        return socketserver.UnixStreamServer(socket_path, GenerationJobHandler)
+    return BoundedThreadingUnixStreamServer(socket_path, GenerationJobHandler, max_concurrent)
+
+
+def configure_worker(worker_index: int, threads: int = None, cpu_affinity: bool = False):
+    """Limit torch threads and optionally pin this worker to its own CPU cores."""
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    if cpu_affinity and hasattr(os, 'sched_setaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+        per_worker = threads or 1
+        start = (worker_index * per_worker) % len(cores)
+        assigned = {cores[(start + i) % len(cores)] for i in range(per_worker)}
+        os.sched_setaffinity(0, assigned)
+        logger.info(f"Worker {worker_index} pinned to cores {sorted(assigned)}")
+
+
+def load_all_models():
+    """Load every model into this process so forked workers can share them."""
+    logger.info("Loading models for resident worker...")
+    import t5_model  # Importing also loads the Sense2Vec and SentenceTransformer models
+    import distractor_generator
+    t5_model.load_models()
+    t5_model.get_nlp()
+    distractor_generator.get_substring_index()
+    distractor_generator.get_ann_index()
+    logger.info("All models loaded")
+
+
+def serve(socket_path: str, threads: int = None, concurrency: int = DEFAULT_CONCURRENCY):
+    """Load all models once and serve up to `concurrency` generation jobs at a time until interrupted."""
+    load_all_models()
+    configure_worker(0, threads)
+
+    server = create_server(socket_path, concurrency)
+    logger.info(f"Question generation worker listening on {socket_path} ({concurrency} concurrent jobs)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def serve_pool(socket_path: str, num_workers: int, threads: int = None, cpu_affinity: bool = False):
+    """Load all models in the parent, then fork workers that share them copy-on-write.
+
+    Workers accept connections from the same listening socket and run each job
+    before accepting the next, so only idle workers take new jobs. Dead workers
+    are replaced.
+    """
+    import torch
+
+    # Split the cores between the workers unless told otherwise
+    threads = threads or max(1, (os.cpu_count() or 1) // num_workers)
+    # Keep the parent single-threaded so no torch thread pool is live across fork()
+    torch.set_num_threads(1)
+    load_all_models()
+
+    server = create_server(socket_path, max_concurrent=None)
+    global _pool_running_jobs
+    _pool_running_jobs = multiprocessing.Array('i', num_workers)
+
+    # Move everything loaded so far out of the GC's reach, so collections in the
+    # workers don't write to (and un-share) the pages holding those objects
+    gc.collect()
+    gc.freeze()
+
+    def spawn_worker(worker_index: int) -> int:
+        global _worker_index
+        # A dead worker's job is over
+        _pool_running_jobs[worker_index] = 0
+        pid = os.fork()
+        if pid == 0:
+            _worker_index = worker_index
+            # Don't inherit the parent's shutdown handler, which would kill sibling workers
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                configure_worker(worker_index, threads, cpu_affinity)
+                logger.info(f"Worker {worker_index} (pid {os.getpid()}) accepting jobs")
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        return pid
+
+    workers = {spawn_worker(i): i for i in range(num_workers)}
+    logger.info(f"Question generation pool of {num_workers} workers listening on {socket_path}")
+
+    def shutdown(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while True:
+        pid, status = os.wait()
+        worker_index = workers.pop(pid, None)
+        if worker_index is None:
+            continue
+        logger.warning(f"Worker {worker_index} (pid {pid}) exited with status {status}, restarting")
+        time.sleep(1)
+        workers[spawn_worker(worker_index)] = worker_index
+
+
+def submit_job(job: dict, socket_path: str = DEFAULT_SOCKET_PATH) -> dict:
+    """Send a job to the resident worker and wait for its reply.
+
+    Raises ConnectionRefusedError or FileNotFoundError if no worker is running.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(job) + "\n").encode('utf-8'))
+        with sock.makefile('r', encoding='utf-8') as reader:
+            reply = reader.readline()
+    if not reply:
+        raise ConnectionError("Worker closed the connection without replying")
+    return json.loads(reply)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--serve', action='store_true', help='Run as the resident worker')
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET_PATH)
+    parser.add_argument('--workers', type=int, default=int(os.getenv('QG_WORKERS', '1')),
+                        help='Number of forked workers sharing the loaded models')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='torch threads per worker (default: CPU cores split between pool workers)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help='Jobs a single (non-pool) worker runs at once')
+    parser.add_argument('--cpu_affinity', action='store_true', help='Pin each worker to its own cores')
+    parser.add_argument('--num_questions', type=int)
+    parser.add_argument('--game_code', type=str)
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--source_key', type=str, default=None)
+    parser.add_argument('--answer_first', action='store_true')
+    args = parser.parse_args()
+
+    if args.serve:
+        if args.workers > 1:
+            serve_pool(args.socket, args.workers, args.threads, args.cpu_affinity)
+        else:
+            serve(args.socket, args.threads, args.concurrency)
+        return
+
+    if args.num_questions is None or not args.game_code:
+        parser.error("--num_questions and --game_code are required unless --serve is given")
+
+    job = {
+        "game_code": args.game_code,
+        "num_questions": args.num_questions,
+        "batch_size": args.batch_size,
+        "source_key": args.source_key,
+        "answer_first": args.answer_first
+    }
+
+    try:
+        response = submit_job(job, args.socket)
+    except (ConnectionRefusedError, FileNotFoundError):
+        logger.warning(f"No worker listening on {args.socket}, generating in-process")
+        import t5_model
+        t5_model.run_generation(args.game_code, args.num_questions, batch_size=args.batch_size,
+                                source_key=args.source_key, answer_first=args.answer_first)
+        return
+
+    logger.info(f"Worker response: {response}")
+    if not response.get('ok'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Thread-safe access to shared Hugging Face fast tokenizers.
+
+Fast tokenizers keep their truncation and padding settings on the Rust side and
+reset them on every call, so two threads using one tokenizer at once can fail
+with "RuntimeError: Already borrowed". The worker shares one tokenizer per model
+between concurrent games, the chunker on the pipeline's source thread, the
+pipeline stages and background chunk store builds, so every call that reaches
+the Rust tokenizer goes through a lock held by that tokenizer.
+"""
+
+import threading
+
+# Tokenizer methods that touch the Rust tokenizer
+LOCKED_METHODS = {
+    "encode", "encode_plus", "batch_encode_plus", "pad", "decode", "batch_decode",
+    "num_special_tokens_to_add", "convert_ids_to_tokens", "convert_tokens_to_ids",
+}
+
+
+class LockedTokenizer:
+    """Wraps a tokenizer so that tokenizing, padding and decoding run one call at a time."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.lock = threading.RLock()
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            return self.tokenizer(*args, **kwargs)
+
+    def __getattr__(self, name):
+        attr = getattr(self.tokenizer, name)
+        if name not in LOCKED_METHODS:
+            return attr
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+        return locked
+
+    def __len__(self) -> int:
+        return len(self.tokenizer)
@@ -0,0 +1,76 @@
+"""
+Packed, memory-mapped string table.
+
+Stores a list of keys as one UTF-8 blob plus an offsets array, with a second
+array giving the rows in sorted key order so keys can be found by binary
+search. Nothing is unpacked into Python objects at load time, so the table is
+cheap to open and can be shared through the page cache across processes.
+"""
+
+import os
+from typing import Iterator, List
+
+import numpy as np
+
+
+class PackedKeys:
+    """Row-indexed key table with key -> row lookup."""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, sorted_rows: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+        self._sorted_rows = sorted_rows
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def __contains__(self, key: str) -> bool:
+        return self.find(key) >= 0
+
+    def find(self, key: str) -> int:
+        """Row of `key`, or -1 if it isn't in the table."""
+        target = key.encode('utf-8')
+        lo, hi = 0, len(self._sorted_rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            row = int(self._sorted_rows[mid])
+            start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+            current = bytes(self._blob[start:end])
+            if current < target:
+                lo = mid + 1
+            elif current > target:
+                hi = mid
+            else:
+                return row
+        return -1
+
+    @classmethod
+    def build(cls, keys: List[str]) -> "PackedKeys":
+        encoded = [key.encode('utf-8') for key in keys]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        sorted_rows = np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int64)
+        return cls(blob, offsets, sorted_rows)
+
+    def save(self, path: str, prefix: str = "keys"):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, f"{prefix}_blob.npy"), self._blob)
+        np.save(os.path.join(path, f"{prefix}_offsets.npy"), self._offsets)
+        np.save(os.path.join(path, f"{prefix}_sorted.npy"), self._sorted_rows)
+
+    @classmethod
+    def load(cls, path: str, prefix: str = "keys") -> "PackedKeys":
+        return cls(
+            np.load(os.path.join(path, f"{prefix}_blob.npy"), mmap_mode='r'),
+            np.load(os.path.join(path, f"{prefix}_offsets.npy"), mmap_mode='r'),
+            np.load(os.path.join(path, f"{prefix}_sorted.npy"), mmap_mode='r')
+        )
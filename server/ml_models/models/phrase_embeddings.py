@@ -0,0 +1,81 @@
+"""
+Precomputed sentence embeddings for the Sense2Vec vocabulary.
+
+`create_multiple_choice` embeds each distractor candidate in its display form
+(cleaned, underscores to spaces, title-cased). This module precomputes that
+embedding for every key of a compact store (see s2v_store.py) and saves it as
+a float16 matrix aligned with the store's rows:
+
+    <store>/phrase_embeddings.npy
+    <store>/phrase_embeddings.json   model name, rows and dimension
+
+At runtime the distractor generator gathers rows from the memory-mapped
+matrix instead of running the transformer on candidates.
+
+    python phrase_embeddings.py build --batch_size 512
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MATRIX_FILE = "phrase_embeddings.npy"
+META_FILE = "phrase_embeddings.json"
+
+
+def load(store_path: str, num_rows: int, model_name: str) -> Optional[np.ndarray]:
+    """Memory-map the table for a store, or None if it is missing or doesn't match."""
+    meta_path = os.path.join(store_path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("model") != model_name or meta.get("num_rows") != num_rows:
+        logger.warning(f"Ignoring phrase embeddings in {store_path}: built for {meta.get('model')} "
+                       f"with {meta.get('num_rows')} rows, expected {model_name} with {num_rows}")
+        return None
+    return np.load(os.path.join(store_path, MATRIX_FILE), mmap_mode='r')
+
+
+def build(store, store_path: str, model, model_name: str, display_form, batch_size: int = 512):
+    """Embed `display_form(key)` for every key of `store`, writing the matrix incrementally."""
+    start = time.time()
+    dim = model.get_sentence_embedding_dimension()
+    matrix = np.lib.format.open_memmap(
+        os.path.join(store_path, MATRIX_FILE), mode='w+', dtype=np.float16, shape=(len(store), dim)
+    )
+    for row in range(0, len(store), batch_size):
+        phrases = [display_form(store.key(i)) for i in range(row, min(row + batch_size, len(store)))]
+        matrix[row:row + len(phrases)] = model.encode(phrases, batch_size=batch_size)
+        if (row // batch_size) % 100 == 0:
+            logger.info(f"Embedded {row + len(phrases)}/{len(store)} phrases")
+    matrix.flush()
+
+    with open(os.path.join(store_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "num_rows": len(store), "dim": dim, "built": time.time()}, f)
+    logger.info(f"Built phrase embeddings for {len(store)} keys in {time.time() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute sentence embeddings for the Sense2Vec vocabulary")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--batch_size', type=int, default=512)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import distractor_generator
+    if not distractor_generator.USE_COMPACT_STORE:
+        parser.error("phrase embeddings are aligned with a compact store; run `python s2v_store.py convert` first")
+    build(distractor_generator.s2v, distractor_generator.s2v_active_path, distractor_generator.model,
+          distractor_generator.SENTENCE_MODEL_NAME, distractor_generator.display_form, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Per-document question bank.
+
+Questions generated for a source document are kept in S3 under
+`question_bank/{document hash}/bank.json`, keyed by the SHA-256 of the
+document's combined_output.txt. New games on a known document are served
+questions nobody has been given yet straight from the bank. Generation only
+runs for the shortfall, and the results are added back to the bank.
+
+A game and a background top-up often update the same bank at the same time, so
+`save` reloads the bank and applies this copy's changes (new questions, serve
+counts and games served) on top by question id instead of overwriting it. Only
+a write landing between that reload and the upload can still be lost.
+"""
+
+import os
+import sys
+import random
+import hashlib
+import datetime
+import logging
+from typing import Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../data_preprocessing'))
+from s3_utils import read_json_from_s3, write_json_to_s3
+
+logger = logging.getLogger(__name__)
+
+BANK_PREFIX = 'question_bank'
+
+
+def document_hash(path: str) -> str:
+    """SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def question_id(qa_pair: Dict) -> str:
+    """Identify a question by its normalised text and correct answer."""
+    text = f"{qa_pair['question'].strip().lower()}|{str(qa_pair['correct_answer']).strip().lower()}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+class QuestionBank:
+    """Questions generated so far for one document, and how often each was served."""
+
+    def __init__(self, doc_hash: str, entries: List[Dict] = None, games_served: int = 0):
+        self.doc_hash = doc_hash
+        self.entries = entries or []
+        self.games_served = games_served
+        self._ids = {entry['id'] for entry in self.entries}
+        self._mark_saved()
+
+    def _mark_saved(self):
+        """Remember the state as last loaded or saved, to tell which changes are ours."""
+        self._saved_games_served = self.games_served
+        self._saved_times_served = {entry['id']: entry['times_served'] for entry in self.entries}
+
+    @property
+    def s3_key(self) -> str:
+        return f"{BANK_PREFIX}/{self.doc_hash}/bank.json"
+
+    @classmethod
+    def load(cls, doc_hash: str) -> "QuestionBank":
+        bank = cls(doc_hash)
+        data = read_json_from_s3(bank.s3_key)
+        if data:
+            bank = cls(doc_hash, data.get('questions', []), data.get('games_served', 0))
+        logger.info(f"Question bank {doc_hash[:12]} has {len(bank.entries)} questions, {bank.unseen_count()} unseen")
+        return bank
+
+    def merge_changes(self, latest: "QuestionBank"):
+        """Apply the changes made to this copy since it was loaded on top of `latest`, and adopt the result."""
+        games_served = latest.games_served + self.games_served - self._saved_games_served
+        latest_entries = {entry['id']: entry for entry in latest.entries}
+        entries = list(latest.entries)
+        for entry in self.entries:
+            served = entry['times_served'] - self._saved_times_served.get(entry['id'], 0)
+            if entry['id'] in latest_entries:
+                latest_entries[entry['id']]['times_served'] += served
+            else:
+                entries.append(entry)
+        self.entries = entries
+        self.games_served = games_served
+        self._ids = {entry['id'] for entry in self.entries}
+
+    def save(self) -> bool:
+        """Merge this copy's changes into the stored bank and write it back."""
+        latest = read_json_from_s3(self.s3_key)
+        if latest:
+            self.merge_changes(QuestionBank(self.doc_hash, latest.get('questions', []), latest.get('games_served', 0)))
+        saved = write_json_to_s3({
+            "document_hash": self.doc_hash,
+            "updated": datetime.datetime.now().isoformat(),
+            "games_served": self.games_served,
+            "questions": self.entries
+        }, self.s3_key)
+        if saved:
+            self._mark_saved()
+        return saved
+
+    def contains(self, qa_pair: Dict) -> bool:
+        return question_id(qa_pair) in self._ids
+
+    def unseen_count(self) -> int:
+        return sum(1 for entry in self.entries if entry['times_served'] == 0)
+
+    def sample(self, n: int) -> List[Dict]:
+        """Take up to `n` random unseen questions and mark them as served."""
+        unseen = [entry for entry in self.entries if entry['times_served'] == 0]
+        chosen = random.sample(unseen, min(n, len(unseen)))
+
+        qa_pairs = []
+        for entry in chosen:
+            entry['times_served'] += 1
+            options = list(entry['qa_pair']['options'])
+            random.shuffle(options)
+            qa_pairs.append({**entry['qa_pair'], "options": options})
+        return qa_pairs
+
+    def add(self, qa_pairs: List[Dict], served: bool) -> int:
+        """Add new questions, skipping ones already in the bank. Returns how many were added."""
+        added = 0
+        for qa_pair in qa_pairs:
+            qid = question_id(qa_pair)
+            if qid in self._ids:
+                continue
+            self._ids.add(qid)
+            self.entries.append({
+                "id": qid,
+                "qa_pair": qa_pair,
+                "times_served": 1 if served else 0,
+                "added": datetime.datetime.now().isoformat()
+            })
+            added += 1
+        return added
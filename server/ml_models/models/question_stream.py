@@ -0,0 +1,75 @@
+"""
+Incremental question delivery for a game.
+
+Each accepted question is written to S3 as its own numbered part under
+`questions/{game_code}/parts/`, followed by an updated
+`questions/{game_code}/manifest.json` listing the parts written so far. Parts
+are written before the manifest that references them, so readers never see a
+missing part. Once `first_ready` questions exist the manifest (and status)
+say so, and the server can start the game while the rest are generated.
+"""
+
+import os
+import sys
+import datetime
+import logging
+from typing import Dict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../data_preprocessing'))
+from s3_utils import write_json_to_s3
+
+logger = logging.getLogger(__name__)
+
+FIRST_QUESTIONS_READY = int(os.getenv('QG_FIRST_QUESTIONS_READY', '2'))
+
+
+class QuestionStream:
+    """Publishes a game's questions one part at a time."""
+
+    def __init__(self, game_code: str, total_questions: int, first_ready: int = FIRST_QUESTIONS_READY):
+        self.game_code = game_code
+        self.total_questions = total_questions
+        self.first_ready = min(first_ready, total_questions)
+        self.parts = []
+        self.complete = False
+        self._write_manifest()
+
+    @property
+    def manifest_key(self) -> str:
+        return f"questions/{self.game_code}/manifest.json"
+
+    @property
+    def ready(self) -> int:
+        return len(self.parts)
+
+    @property
+    def first_questions_ready(self) -> bool:
+        return self.ready >= self.first_ready
+
+    def _write_manifest(self):
+        write_json_to_s3({
+            "parts": self.parts,
+            "questions_ready": self.ready,
+            "total_questions": self.total_questions,
+            "first_questions_ready": self.first_questions_ready,
+            "complete": self.complete,
+            "timestamp": str(datetime.datetime.now())
+        }, self.manifest_key)
+
+    def append(self, qa_pair: Dict) -> int:
+        """Publish one more question. Returns the number of questions now available."""
+        part_key = f"questions/{self.game_code}/parts/{len(self.parts) + 1:04d}.json"
+        if not write_json_to_s3(qa_pair, part_key):
+            logger.error(f"Failed to write question part {part_key}")
+            return self.ready
+
+        self.parts.append(part_key)
+        self._write_manifest()
+        if self.ready == self.first_ready:
+            logger.info(f"First {self.ready} questions ready for game {self.game_code}")
+        return self.ready
+
+    def finish(self):
+        """Mark the stream complete once every question has been published."""
+        self.complete = True
+        self._write_manifest()
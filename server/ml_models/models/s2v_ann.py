@@ -0,0 +1,213 @@
+"""
+Approximate nearest-neighbour index for Sense2Vec `most_similar`.
+
+`s2v.most_similar` compares the query against every vector in the table. This
+module builds an IVF (inverted file) index offline: vectors are normalised,
+clustered with k-means, and stored grouped by cluster in memory-mapped arrays.
+A query only scores the vectors in the `nprobe` clusters whose centroids are
+closest to it. Raising `nprobe` trades latency for recall.
+
+    python s2v_ann.py build
+    python s2v_ann.py benchmark --queries 200 --nprobe 4 8 16 32
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from typing import List, Tuple
+
+import numpy as np
+
+from packed_keys import PackedKeys
+from s2v_store import CompactSense2Vec, export_sense2vec, normalize, active_s2v_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ANN_PATH = f"{active_s2v_path()}_ann"
+DEFAULT_NPROBE = int(os.getenv('S2V_ANN_NPROBE', '16'))
+BLOCK_SIZE = 65536
+
+
+def export_vectors(s2v) -> Tuple[List[str], np.ndarray]:
+    """Pull (keys, vectors) out of a Sense2Vec model or compact store, row-aligned."""
+    if isinstance(s2v, CompactSense2Vec):
+        return list(s2v.keys()), s2v.vectors
+    keys, vectors, _, _ = export_sense2vec(s2v)
+    return keys, vectors
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for each (normalised) vector, in blocks."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + BLOCK_SIZE], dtype=np.float32)
+        assignments[start:start + BLOCK_SIZE] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors: np.ndarray, num_clusters: int, iterations: int = 10,
+                     sample_size: int = 200000, seed: int = 0) -> np.ndarray:
+    """Cluster normalised vectors by cosine similarity, training on a random sample."""
+    rng = np.random.default_rng(seed)
+    sample_idx = rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)
+    sample = np.asarray(vectors[np.sort(sample_idx)], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), num_clusters, replace=False)].copy()
+
+    for iteration in range(iterations):
+        assignments = assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=num_clusters)
+
+        # Re-seed empty clusters with random sample points
+        empty = np.where(counts == 0)[0]
+        if len(empty):
+            sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalize(sums)
+        logger.info(f"k-means iteration {iteration + 1}/{iterations}, {len(empty)} empty clusters")
+
+    return centroids
+
+
+class IVFIndex:
+    """Memory-mapped IVF index over normalised Sense2Vec vectors."""
+
+    def __init__(self, keys: PackedKeys, vectors: np.ndarray, centroids: np.ndarray, list_offsets: np.ndarray):
+        self.keys = keys
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    @classmethod
+    def build(cls, keys: List[str], vectors: np.ndarray, num_clusters: int = None, iterations: int = 10,
+              dtype=np.float16) -> "IVFIndex":
+        vectors = normalize(vectors)
+        num_clusters = num_clusters or max(1, int(4 * np.sqrt(len(vectors))))
+        logger.info(f"Clustering {len(vectors)} vectors into {num_clusters} lists")
+        centroids = spherical_kmeans(vectors, num_clusters, iterations)
+        assignments = assign_to_centroids(vectors, centroids)
+
+        # Store vectors grouped by list so each probe reads one contiguous range
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=num_clusters)
+        list_offsets = np.zeros(num_clusters + 1, dtype=np.int64)
+        np.cumsum(counts, out=list_offsets[1:])
+
+        return cls(PackedKeys.build([keys[i] for i in order]), vectors[order].astype(dtype),
+                   centroids, list_offsets)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.keys.save(path)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "list_offsets.npy"), self.list_offsets)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"num_keys": len(self), "num_lists": len(self.centroids),
+                       "dtype": str(self.vectors.dtype), "built": time.time()}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        return cls(
+            PackedKeys.load(path),
+            np.load(os.path.join(path, "vectors.npy"), mmap_mode='r'),
+            np.load(os.path.join(path, "centroids.npy")),
+            np.load(os.path.join(path, "list_offsets.npy"))
+        )
+
+    def _top_n(self, rows: np.ndarray, scores: np.ndarray, exclude: int, n: int) -> List[Tuple[str, float]]:
+        keep = rows != exclude
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > n:
+            top = np.argpartition(-scores, n)[:n]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return [(self.keys[int(rows[i])], float(scores[i])) for i in order]
+
+    def most_similar(self, key: str, n: int = 10, nprobe: int = DEFAULT_NPROBE) -> List[Tuple[str, float]]:
+        """Approximate `s2v.most_similar(key, n)`: (key, cosine) pairs, excluding `key` itself."""
+        row = self.keys.find(key)
+        if row < 0:
+            raise ValueError(f"Can't find key {key} in table")
+        query = np.asarray(self.vectors[row], dtype=np.float32)
+
+        lists = np.argsort(-(self.centroids @ query))[:nprobe]
+        rows = np.concatenate([
+            np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists
+        ])
+        scores = np.concatenate([
+            np.asarray(self.vectors[self.list_offsets[i]:self.list_offsets[i + 1]], dtype=np.float32) @ query
+            for i in lists
+        ])
+        return self._top_n(rows, scores, row, n)
+
+    def exact_most_similar(self, key: str, n: int = 10) -> List[Tuple[str, float]]:
+        """Brute-force search over every vector, for benchmarking."""
+        row = self.keys.find(key)
+        if row < 0:
+            raise ValueError(f"Can't find key {key} in table")
+        query = np.asarray(self.vectors[row], dtype=np.float32)
+        scores = np.concatenate([
+            np.asarray(self.vectors[start:start + BLOCK_SIZE], dtype=np.float32) @ query
+            for start in range(0, len(self), BLOCK_SIZE)
+        ])
+        return self._top_n(np.arange(len(self)), scores, row, n)
+
+
+def benchmark(index: IVFIndex, num_queries: int, nprobes: List[int], n: int = 30, seed: int = 0):
+    """Log recall@n and latency of the IVF search against exact search."""
+    rng = np.random.default_rng(seed)
+    queries = [index.keys[int(row)] for row in rng.choice(len(index), num_queries, replace=False)]
+
+    start = time.perf_counter()
+    exact = {key: {k for k, _ in index.exact_most_similar(key, n)} for key in queries}
+    exact_ms = (time.perf_counter() - start) * 1000 / num_queries
+    logger.info(f"exact: {exact_ms:.2f} ms/query")
+
+    for nprobe in nprobes:
+        latencies = []
+        recalls = []
+        for key in queries:
+            start = time.perf_counter()
+            found = index.most_similar(key, n, nprobe=nprobe)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(exact[key] & {k for k, _ in found}) / max(1, len(exact[key])))
+        logger.info(
+            f"nprobe={nprobe}: recall@{n}={np.mean(recalls):.3f}, "
+            f"{np.mean(latencies):.2f} ms/query (p95 {np.percentile(latencies, 95):.2f} ms)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or benchmark the Sense2Vec ANN index")
+    parser.add_argument('command', choices=['build', 'benchmark'])
+    parser.add_argument('--index_path', type=str, default=None,
+                        help='Defaults to the path the distractor generator loads from')
+    parser.add_argument('--num_lists', type=int, default=None)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'build':
+        from distractor_generator import s2v
+        index_path = args.index_path or DEFAULT_ANN_PATH
+        keys, vectors = export_vectors(s2v)
+        index = IVFIndex.build(keys, vectors, args.num_lists, args.iterations)
+        index.save(index_path)
+        logger.info(f"Saved ANN index over {len(index)} vectors to {index_path}")
+    else:
+        benchmark(IVFIndex.load(args.index_path or DEFAULT_ANN_PATH), args.queries, args.nprobe)
+
+
+if __name__ == "__main__":
+    main()
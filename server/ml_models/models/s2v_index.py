@@ -0,0 +1,243 @@
+"""
+Substring index over the Sense2Vec vocabulary.
+
+`create_multiple_choice` looks for vocabulary keys containing an answer when
+there is no direct match. Scanning millions of keys in Python for every lookup
+is slow, so this module builds a trigram inverted index over the lowercased
+keys once and stores it next to the Sense2Vec model as memory-mapped arrays.
+
+Keys are stored pre-sorted by the query-independent part of the ranking used
+by `create_multiple_choice`, so a query only has to intersect posting lists,
+verify the candidates and apply the final "exact base word" tie-break.
+
+Build it ahead of time with:
+
+    python s2v_index.py build
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+from typing import Iterable, List
+
+import numpy as np
+
+from s2v_store import active_s2v_path
+
+logger = logging.getLogger(__name__)
+
+PREFERRED_TAGS = ['NOUN', 'PERSON', 'GPE', 'LOC']
+PENALISED_TERMS = ['movie', 'show', 'express', 'film']
+NGRAM = 3
+
+DEFAULT_INDEX_PATH = f"{active_s2v_path()}_substring_index"
+
+
+def base_rank(key: str) -> tuple:
+    """Query-independent part of the ranking for keys matching a lookup word."""
+    return (
+        len(key.split('_')),
+        0 if key.split('|')[1] in PREFERRED_TAGS else 1,
+        1 if any(term in key.lower() for term in PENALISED_TERMS) else 0
+    )
+
+
+def similar_word_rank(key: str, lookup_word: str) -> tuple:
+    """Full ranking for keys matching `lookup_word` (simplest, preferred tags first)."""
+    return base_rank(key) + (0 if key.split('|')[0].lower() == lookup_word else 1,)
+
+
+def ngrams(text: str, n: int = NGRAM) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _pack(strings: List[str]) -> tuple:
+    """Concatenate strings into one blob plus an offsets array."""
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+    return "".join(strings), offsets
+
+
+class SubstringIndex:
+    """Answers `[key for key in keys if word in key.lower()]`, ranked, without a full scan."""
+
+    def __init__(self, keys_blob: str, key_offsets: np.ndarray, lower_blob: str, lower_offsets: np.ndarray,
+                 groups: np.ndarray, trigrams: np.ndarray, trigram_offsets: np.ndarray, postings: np.ndarray):
+        self._keys_blob = keys_blob
+        self._key_offsets = key_offsets
+        self._lower_blob = lower_blob
+        self._lower_offsets = lower_offsets
+        self._groups = groups
+        self._trigrams = trigrams
+        self._trigram_offsets = trigram_offsets
+        self._postings = postings
+
+    def __len__(self) -> int:
+        return len(self._key_offsets) - 1
+
+    def key(self, row: int) -> str:
+        return self._keys_blob[self._key_offsets[row]:self._key_offsets[row + 1]]
+
+    def lower_key(self, row: int) -> str:
+        return self._lower_blob[self._lower_offsets[row]:self._lower_offsets[row + 1]]
+
+    @classmethod
+    def build(cls, keys: Iterable[str]) -> "SubstringIndex":
+        """Build the index from vocabulary keys in their original order."""
+        keys = list(keys)
+        # Sort by the base rank; ties keep vocabulary order, as Python's stable sort would
+        ranked = sorted(range(len(keys)), key=lambda i: base_rank(keys[i]) + (i,))
+        ranked_keys = [keys[i] for i in ranked]
+
+        groups = np.zeros(len(ranked_keys), dtype=np.int32)
+        previous = None
+        group = -1
+        for row, key in enumerate(ranked_keys):
+            rank = base_rank(key)
+            if rank != previous:
+                group += 1
+                previous = rank
+            groups[row] = group
+
+        lowered = [key.lower() for key in ranked_keys]
+        postings_by_gram = {}
+        for row, key in enumerate(lowered):
+            for gram in ngrams(key):
+                postings_by_gram.setdefault(gram, []).append(row)
+
+        trigrams = sorted(postings_by_gram)
+        trigram_offsets = np.zeros(len(trigrams) + 1, dtype=np.int64)
+        np.cumsum([len(postings_by_gram[g]) for g in trigrams], out=trigram_offsets[1:])
+        postings = np.fromiter(
+            (row for g in trigrams for row in postings_by_gram[g]),
+            dtype=np.int32,
+            count=int(trigram_offsets[-1])
+        )
+
+        keys_blob, key_offsets = _pack(ranked_keys)
+        lower_blob, lower_offsets = _pack(lowered)
+        return cls(keys_blob, key_offsets, lower_blob, lower_offsets, groups,
+                   np.array(trigrams, dtype=f'<U{NGRAM}'), trigram_offsets, postings)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "keys.txt"), "w", encoding="utf-8") as f:
+            f.write(self._keys_blob)
+        with open(os.path.join(path, "lower.txt"), "w", encoding="utf-8") as f:
+            f.write(self._lower_blob)
+        for name in ["key_offsets", "lower_offsets", "groups", "trigrams", "trigram_offsets", "postings"]:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, f"_{name}"))
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"num_keys": len(self), "ngram": NGRAM, "built": time.time()}, f)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path: str) -> "SubstringIndex":
+        with open(os.path.join(path, "keys.txt"), "r", encoding="utf-8") as f:
+            keys_blob = f.read()
+        with open(os.path.join(path, "lower.txt"), "r", encoding="utf-8") as f:
+            lower_blob = f.read()
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+            for name in ["key_offsets", "lower_offsets", "groups", "trigram_offsets", "postings"]
+        }
+        trigrams = np.load(os.path.join(path, "trigrams.npy"))
+        return cls(keys_blob, arrays["key_offsets"], lower_blob, arrays["lower_offsets"], arrays["groups"],
+                   trigrams, arrays["trigram_offsets"], arrays["postings"])
+
+    def _posting(self, gram: str) -> np.ndarray:
+        i = int(np.searchsorted(self._trigrams, gram))
+        if i == len(self._trigrams) or self._trigrams[i] != gram:
+            return np.empty(0, dtype=np.int32)
+        return self._postings[self._trigram_offsets[i]:self._trigram_offsets[i + 1]]
+
+    def candidate_rows(self, word: str) -> np.ndarray:
+        """Rows whose lowercased key contains every trigram of `word`."""
+        grams = ngrams(word)
+        if not grams:
+            # Too short for trigrams: every key is a candidate
+            return np.arange(len(self), dtype=np.int32)
+
+        postings = sorted((self._posting(g) for g in grams), key=len)
+        rows = np.asarray(postings[0])
+        for posting in postings[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, posting, assume_unique=True)
+        return rows
+
+    def search(self, lookup_word: str, limit: int = None) -> List[str]:
+        """Keys containing `lookup_word` (case-insensitively), ranked like `create_multiple_choice`."""
+        rows = []
+        cutoff = None
+        # Candidates are in base-rank order, so once `limit` matches are found only
+        # the rest of that rank group can still overtake them via the tie-break
+        for row in self.candidate_rows(lookup_word):
+            row = int(row)
+            group = int(self._groups[row])
+            if cutoff is not None and group > cutoff:
+                break
+            if lookup_word in self.lower_key(row):
+                rows.append(row)
+                if limit is not None and cutoff is None and len(rows) >= limit:
+                    cutoff = group
+
+        rows.sort(key=lambda row: (int(self._groups[row]), 0 if self.key(row).split('|')[0].lower() == lookup_word else 1))
+        if limit is not None:
+            rows = rows[:limit]
+        return [self.key(row) for row in rows]
+
+
+def load_or_build(index_path: str, keys_fn) -> SubstringIndex:
+    """Load the index from `index_path`, building and saving it from `keys_fn()` if missing."""
+    if SubstringIndex.exists(index_path):
+        logger.info(f"Loading Sense2Vec substring index from {index_path}")
+        return SubstringIndex.load(index_path)
+
+    logger.info("Building Sense2Vec substring index (one-off)...")
+    start = time.time()
+    index = SubstringIndex.build(keys_fn())
+    try:
+        index.save(index_path)
+    except OSError as e:
+        logger.warning(f"Failed to save substring index to {index_path}: {e}")
+    logger.info(f"Built substring index over {len(index)} keys in {time.time() - start:.1f}s")
+    return index
+
+
+def scan_keys(keys: Iterable[str], lookup_word: str, limit: int = None) -> List[str]:
+    """`SubstringIndex.search` by scanning every key, for when the index isn't available yet."""
+    matches = sorted((key for key in keys if lookup_word in key.lower()),
+                     key=lambda key: similar_word_rank(key, lookup_word))
+    return matches[:limit] if limit is not None else matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the Sense2Vec substring index")
+    parser.add_argument('command', choices=['build', 'query'])
+    parser.add_argument('--index_path', type=str, default=None,
+                        help='Defaults to the path the distractor generator loads from')
+    parser.add_argument('--word', type=str, help='Lookup word for the query command')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'build':
+        from distractor_generator import s2v
+        index_path = args.index_path or DEFAULT_INDEX_PATH
+        index = SubstringIndex.build(s2v.keys())
+        index.save(index_path)
+        logger.info(f"Saved substring index over {len(index)} keys to {index_path}")
+    else:
+        index = SubstringIndex.load(args.index_path or DEFAULT_INDEX_PATH)
+        start = time.perf_counter()
+        matches = index.search(args.word, limit=10)
+        logger.info(f"{(time.perf_counter() - start) * 1000:.2f} ms: {matches}")
+
+
+if __name__ == "__main__":
+    main()
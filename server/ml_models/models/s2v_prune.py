@@ -0,0 +1,166 @@
+"""
+Pruned Sense2Vec vocabulary build.
+
+Most Sense2Vec keys never become answers or distractors: distractors must share
+the answer's sense tag, and answers are short nouns and entities. This module
+keeps only keys that pass a frequency, sense tag and token-length filter, and
+writes the result in the compact store format (see s2v_store.py). Point the
+distractor generator at it with S2V_COMPACT_PATH.
+
+    python s2v_prune.py build --min_freq 10 --max_tokens 4
+    python s2v_prune.py report --corpus ../outputs/combined_output.txt
+
+`report` compares the full and pruned vocabularies on answer candidates taken
+from a sample corpus: how many still get a sense, and how many of their
+same-sense neighbours survive.
+"""
+
+import os
+import json
+import random
+import logging
+import argparse
+from typing import Dict, List
+
+import numpy as np
+
+from s2v_store import CompactSense2Vec, from_arrays, export_sense2vec
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INPUT_PATH = os.path.join(MODELS_DIR, "s2v_old_compact")
+DEFAULT_OUTPUT_PATH = os.path.join(MODELS_DIR, "s2v_old_pruned")
+
+# Senses quiz answers (and so their distractors) end up with
+ANSWER_SENSES = [
+    'NOUN', 'PROPN', 'PERSON', 'GPE', 'LOC', 'ORG', 'NORP', 'FAC',
+    'PRODUCT', 'EVENT', 'WORK_OF_ART', 'LANGUAGE', 'LAW', 'DATE'
+]
+NEIGHBOURS = 30
+MIN_DISTRACTORS = 3
+
+
+def load_store(path: str) -> CompactSense2Vec:
+    """Open a compact store, or convert a Sense2Vec model directory in memory."""
+    if CompactSense2Vec.exists(path):
+        return CompactSense2Vec.load(path)
+
+    from sense2vec import Sense2Vec
+    logger.info(f"{path} is not a compact store, loading it with Sense2Vec")
+    return from_arrays(*export_sense2vec(Sense2Vec().from_disk(path)))
+
+
+def keep_key(key: str, freq: int, senses: set, min_freq: int, max_tokens: int) -> bool:
+    word, _, sense = key.rpartition('|')
+    return sense in senses and freq >= min_freq and len(word.split('_')) <= max_tokens
+
+
+def prune(store: CompactSense2Vec, senses: List[str], min_freq: int, max_tokens: int) -> CompactSense2Vec:
+    """Copy of `store` with only the keys passing the filter, in their original order."""
+    sense_set = set(senses)
+    rows = np.array([
+        row for row, key in enumerate(store.keys())
+        if keep_key(key, int(store.freqs[row]), sense_set, min_freq, max_tokens)
+    ], dtype=np.int64)
+
+    pruned = from_arrays(
+        [store.key(int(row)) for row in rows],
+        np.asarray(store.vectors[rows], dtype=np.float32),
+        [int(store.freqs[row]) for row in rows],
+        [sense for sense in store.senses if sense in sense_set]
+    )
+    logger.info(f"Kept {len(pruned)} of {len(store)} keys ({len(pruned) / max(1, len(store)):.1%})")
+    return pruned
+
+
+def corpus_phrases(corpus_path: str, max_phrases: int, seed: int = 0) -> List[str]:
+    """Answer candidates (entities and noun chunks) from a sample corpus."""
+    from answer_first import get_nlp, strip_leading_words
+
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    nlp = get_nlp()
+    phrases = set()
+    for paragraph in filter(None, (p.strip() for p in text.split('\n'))):
+        doc = nlp(paragraph[:nlp.max_length])
+        for span in list(doc.ents) + list(doc.noun_chunks):
+            phrase, _ = strip_leading_words(span.text.strip(), span.start_char)
+            if phrase and any(c.isalpha() for c in phrase):
+                phrases.add(phrase)
+
+    phrases = sorted(phrases)
+    random.Random(seed).shuffle(phrases)
+    return phrases[:max_phrases]
+
+
+def hit_rate_report(full: CompactSense2Vec, pruned: CompactSense2Vec, phrases: List[str]) -> Dict:
+    """How well the pruned vocabulary still serves answers found in `phrases`."""
+    full_hits = pruned_hits = same_sense = enough_distractors = 0
+    retained = []
+    for phrase in phrases:
+        full_sense = full.get_best_sense(phrase)
+        if not full_sense:
+            continue
+        full_hits += 1
+
+        pruned_sense = pruned.get_best_sense(phrase)
+        if not pruned_sense:
+            continue
+        pruned_hits += 1
+        same_sense += pruned_sense == full_sense
+
+        # Distractor candidates are neighbours with the answer's sense tag
+        tag = pruned_sense.split('|')[1]
+        neighbours = [key for key, _ in full.most_similar(pruned_sense, n=NEIGHBOURS) if key.endswith(f"|{tag}")]
+        kept = sum(1 for key in neighbours if key in pruned)
+        retained.append(kept / len(neighbours) if neighbours else 1.0)
+        enough_distractors += kept >= MIN_DISTRACTORS
+
+    total = max(1, len(phrases))
+    return {
+        "phrases": len(phrases),
+        "full_keys": len(full),
+        "pruned_keys": len(pruned),
+        "full_hit_rate": full_hits / total,
+        "pruned_hit_rate": pruned_hits / total,
+        "same_best_sense": same_sense / max(1, pruned_hits),
+        "neighbours_retained": float(np.mean(retained)) if retained else 0.0,
+        "enough_distractors_rate": enough_distractors / total
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or evaluate a pruned Sense2Vec vocabulary")
+    parser.add_argument('command', choices=['build', 'report'])
+    parser.add_argument('--input', type=str, default=DEFAULT_INPUT_PATH,
+                        help='Compact store or Sense2Vec model directory to prune')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument('--senses', type=str, nargs='+', default=ANSWER_SENSES)
+    parser.add_argument('--min_freq', type=int, default=10)
+    parser.add_argument('--max_tokens', type=int, default=4)
+    parser.add_argument('--corpus', type=str, help='Sample text for the report command')
+    parser.add_argument('--max_phrases', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    full = load_store(args.input)
+    if args.command == 'build':
+        pruned = prune(full, args.senses, args.min_freq, args.max_tokens)
+        pruned.save(args.output)
+        logger.info(f"Saved pruned vocabulary to {args.output}")
+        return
+
+    if not args.corpus:
+        parser.error("report requires --corpus")
+    if CompactSense2Vec.exists(args.output):
+        pruned = CompactSense2Vec.load(args.output)
+    else:
+        pruned = prune(full, args.senses, args.min_freq, args.max_tokens)
+    report = hit_rate_report(full, pruned, corpus_phrases(args.corpus, args.max_phrases))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Compact, memory-mapped Sense2Vec store.
+
+`Sense2Vec().from_disk()` reads the float32 vector table and the JSON string
+and frequency tables into each process's private heap. This module converts a
+Sense2Vec model once into a directory of `.npy` files:
+
+    vectors.npy     float16, L2-normalised, one row per key
+    keys_*.npy      packed key table (see packed_keys.py)
+    freqs.npy       key frequencies, row-aligned (-1 if unknown)
+    meta.json       senses and build info
+
+The arrays are opened with `numpy` memory mapping, so forked and separate
+worker processes share the same page cache. `CompactSense2Vec` exposes the
+part of the Sense2Vec API the distractor generator uses.
+
+    python s2v_store.py convert --input s2v_old --output s2v_old_compact
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import argparse
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from packed_keys import PackedKeys
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 65536
+MODELS_DIR = os.path.dirname(os.path.abspath(__file__))
+S2V_PATH = os.path.join(MODELS_DIR, "s2v_old")
+S2V_COMPACT_PATH = os.getenv('S2V_COMPACT_PATH', f"{S2V_PATH}_compact")
+
+
+def make_key(word: str, sense: str) -> str:
+    """Same key format as `sense2vec.Sense2Vec.make_key`, e.g. "New_York|GPE"."""
+    text = re.sub(r"\s", "_", word)
+    return text + "|" + sense
+
+
+class CompactSense2Vec:
+    """Read-only Sense2Vec replacement backed by memory-mapped arrays."""
+
+    def __init__(self, keys: PackedKeys, vectors: np.ndarray, freqs: np.ndarray, senses: List[str],
+                 name: str = "s2v_compact"):
+        self._keys = keys
+        self.vectors = vectors
+        self.freqs = freqs
+        self.senses = senses
+        self.name = name
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        return isinstance(key, str) and self._keys.find(key) >= 0
+
+    def __getitem__(self, key: str) -> Optional[np.ndarray]:
+        row = self._keys.find(key)
+        return None if row < 0 else np.asarray(self.vectors[row], dtype=np.float32)
+
+    def keys(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def row(self, key: str) -> int:
+        return self._keys.find(key)
+
+    def key(self, row: int) -> str:
+        return self._keys[row]
+
+    def get_freq(self, key: str, default=None):
+        row = self._keys.find(key)
+        if row < 0 or self.freqs[row] < 0:
+            return default
+        return int(self.freqs[row])
+
+    def make_key(self, word: str, sense: str) -> str:
+        return make_key(word, sense)
+
+    def get_best_sense(self, word: str, senses: List[str] = None, ignore_case: bool = True) -> Optional[str]:
+        """Most frequent key for `word` across the given (or all) senses, as in Sense2Vec."""
+        sense_options = senses or self.senses
+        if not sense_options:
+            return None
+        versions = [word, word.upper(), word.title()] if ignore_case else [word]
+        freqs = []
+        for text in versions:
+            for sense in sense_options:
+                key = make_key(text, sense)
+                if key in self:
+                    freqs.append((self.get_freq(key, -1), key))
+        return max(freqs)[1] if freqs else None
+
+    def most_similar(self, keys: Union[str, List[str]], n: int = 10) -> List[Tuple[str, float]]:
+        """Exact cosine search around the mean of `keys`, excluding the keys themselves."""
+        if isinstance(keys, str):
+            keys = [keys]
+        rows = [self._keys.find(key) for key in keys]
+        for key, row in zip(keys, rows):
+            if row < 0:
+                raise ValueError(f"Can't find key {key} in table")
+
+        query = np.asarray(self.vectors[rows], dtype=np.float32).mean(axis=0)
+        query /= max(float(np.linalg.norm(query)), 1e-8)
+        scores = np.concatenate([
+            np.asarray(self.vectors[start:start + BLOCK_SIZE], dtype=np.float32) @ query
+            for start in range(0, len(self), BLOCK_SIZE)
+        ])
+        scores[rows] = -np.inf
+
+        n = min(n, len(self) - len(set(rows)))
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return [(self._keys[int(row)], float(scores[row])) for row in top]
+
+    def most_similar_batch(self, keys: List[str], n: int = 10) -> List[List[Tuple[str, float]]]:
+        """`most_similar(key, n)` for each key, scoring all queries in one pass over the table."""
+        rows = np.array([self._keys.find(key) for key in keys], dtype=np.int64)
+        for key, row in zip(keys, rows):
+            if row < 0:
+                raise ValueError(f"Can't find key {key} in table")
+        if len(rows) == 0:
+            return []
+
+        queries = np.asarray(self.vectors[rows], dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-8)
+
+        # Keep the n + 1 best rows per query from each block, then merge
+        best_rows, best_scores = [], []
+        for start in range(0, len(self), BLOCK_SIZE):
+            scores = np.asarray(self.vectors[start:start + BLOCK_SIZE], dtype=np.float32) @ queries.T
+            k = min(n + 1, len(scores))
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            best_rows.append(top + start)
+            best_scores.append(np.take_along_axis(scores, top, axis=0))
+        best_rows = np.concatenate(best_rows)
+        best_scores = np.concatenate(best_scores)
+
+        results = []
+        for q, row in enumerate(rows):
+            candidates = best_rows[:, q]
+            scores = np.where(candidates == row, -np.inf, best_scores[:, q])
+            order = np.argsort(-scores)[:min(n, len(self) - 1)]
+            results.append([(self._keys[int(candidates[i])], float(scores[i])) for i in order])
+        return results
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self._keys.save(path)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        np.save(os.path.join(path, "freqs.npy"), self.freqs)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"num_keys": len(self), "senses": self.senses, "dtype": str(self.vectors.dtype),
+                       "built": time.time()}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "CompactSense2Vec":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            PackedKeys.load(path),
+            np.load(os.path.join(path, "vectors.npy"), mmap_mode='r'),
+            np.load(os.path.join(path, "freqs.npy"), mmap_mode='r'),
+            meta.get("senses", []),
+            name=os.path.basename(os.path.normpath(path))
+        )
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def from_arrays(keys: List[str], vectors: np.ndarray, freqs: List[int], senses: List[str],
+                dtype=np.float16) -> CompactSense2Vec:
+    """Build a store from row-aligned keys, vectors and frequencies."""
+    return CompactSense2Vec(
+        PackedKeys.build(keys),
+        normalize(vectors).astype(dtype),
+        np.array([-1 if freq is None else freq for freq in freqs], dtype=np.int64),
+        list(senses)
+    )
+
+
+def export_sense2vec(s2v) -> Tuple[List[str], np.ndarray, List[int], List[str]]:
+    """Pull (keys, vectors, freqs, senses) out of a loaded Sense2Vec model, row-aligned."""
+    key2row = s2v.vectors.key2row
+    keys = [s2v.strings[key] for key in key2row]
+    rows = np.fromiter(key2row.values(), dtype=np.int64, count=len(key2row))
+    freqs = [s2v.get_freq(key) for key in keys]
+    return keys, np.asarray(s2v.vectors.data)[rows], freqs, list(s2v.cfg.get("senses", []))
+
+
+def active_s2v_path() -> str:
+    """Path of the Sense2Vec model the distractor generator uses.
+
+    The compact store if it has been built (and S2V_COMPACT isn't 0), else
+    s2v_old. Indexes over the vocabulary are stored next to it.
+    """
+    if os.getenv('S2V_COMPACT', '1') != '0' and CompactSense2Vec.exists(S2V_COMPACT_PATH):
+        return S2V_COMPACT_PATH
+    return S2V_PATH
+
+
+def convert(input_path: str, output_path: str):
+    from sense2vec import Sense2Vec
+
+    start = time.time()
+    s2v = Sense2Vec().from_disk(input_path)
+    store = from_arrays(*export_sense2vec(s2v))
+    store.save(output_path)
+    logger.info(f"Converted {len(store)} keys from {input_path} to {output_path} in {time.time() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a Sense2Vec model to the compact memory-mapped store")
+    parser.add_argument('command', choices=['convert'])
+    parser.add_argument('--input', type=str, default=S2V_PATH)
+    parser.add_argument('--output', type=str, default=S2V_COMPACT_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    convert(args.input, args.output)
+
+
+if __name__ == "__main__":
+    main()
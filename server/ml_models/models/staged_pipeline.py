@@ -0,0 +1,115 @@
+"""
+Producer/consumer pipeline for running the question generation stages concurrently.
+
+Each stage runs in its own thread and is connected to the next by a bounded
+queue, so e.g. distractor generation for one batch overlaps T5 decoding of the
+next. A stage is a callable taking one item and returning an iterable of items
+for the next stage (an empty iterable drops the item).
+"""
+
+import queue
+import threading
+import logging
+from typing import Callable, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # Sentinel passed down the queues when a stage has no more input
+
+
+class StagedPipeline:
+    """Run `source` through `stages`, each in its own thread.
+
+    Iterating the pipeline yields the output of the last stage as it becomes
+    available. Call `stop()` (or leave the `with` block) to cancel remaining
+    work; stages finish the item they are on and then exit.
+    """
+
+    def __init__(self, source: Iterable, stages: List[Callable], queue_size: int = 2):
+        self._source = source
+        self._stages = stages
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = []
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, error: Exception):
+        logger.error(f"Pipeline stage failed: {str(error)}")
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _feed(self):
+        try:
+            for item in self._source:
+                if not self._put(self._queues[0], item):
+                    return
+            self._put(self._queues[0], _DONE)
+        except Exception as e:
+            self._fail(e)
+
+    def _run_stage(self, index: int):
+        stage = self._stages[index]
+        inbox, outbox = self._queues[index], self._queues[index + 1]
+        try:
+            while True:
+                item = self._get(inbox)
+                if item is _DONE:
+                    self._put(outbox, _DONE)
+                    return
+                for result in stage(item):
+                    if not self._put(outbox, result):
+                        return
+        except Exception as e:
+            self._fail(e)
+
+    def start(self):
+        self._threads = [threading.Thread(target=self._feed, name="pipeline-source", daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._run_stage, args=(i,), name=f"pipeline-stage-{i}", daemon=True)
+            for i in range(len(self._stages))
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __iter__(self):
+        if not self._threads:
+            self.start()
+        while True:
+            item = self._get(self._queues[-1])
+            if item is _DONE:
+                break
+            yield item
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        """Cancel remaining work and wait for the stage threads to exit."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
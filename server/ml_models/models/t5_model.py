@@ -1,13 +1,30 @@
-from transformers import T5ForConditionalGeneration, T5TokenizerFast, pipeline, AutoTokenizer, AutoModelForQuestionAnswering
+from transformers import T5ForConditionalGeneration, T5TokenizerFast, AutoTokenizer, AutoModelForQuestionAnswering
 import torch
 import json
 import random
-from distractor_generator import create_multiple_choice
+from distractor_generator import create_multiple_choice_batch, DISTRACTOR_MODEL_VERSION, s2v, S2V_NAME
+import distractor_generator
+from staged_pipeline import StagedPipeline
+from answer_extraction import extract_best_answers
+from answer_first import select_answer_candidates, build_highlight_prompt, get_nlp, answer_matches
+from disk_cache import DiskLRUCache, make_key, DEFAULT_CACHE_DIR
+from locked_tokenizer import LockedTokenizer
+from question_bank import QuestionBank, document_hash
+from document_distractors import DocumentPhraseTable
+from question_stream import QuestionStream
+from chunker import iter_chunks, shuffle_buffer, MIN_PARAGRAPH_LENGTH
+import chunk_store
+from chunk_store import ChunkStore
+from chunk_scoring import get_chunk_scores, visit_order
+import chunk_scheduler
+from chunk_scheduler import ChunkRejected, RegionScheduler, rejection_reason
+from chunk_diversity import get_chunk_embeddings, QuestionDeduper
 import datetime
-from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Tuple
+import itertools
+import threading
+import shutil
 import gc
-import re
 import argparse
 import traceback
 import logging
@@ -24,19 +41,62 @@ logger = logging.getLogger(__name__)
 # Global variables
 MODEL_CACHE = {}
 NUM_QUESTIONS = 5  # Default number of questions
+QG_MODEL_NAME = "valhalla/t5-base-qg-hl"
+QA_MODEL_NAME = "deepset/roberta-base-squad2"
+QG_GENERATION_PARAMS = {
+    "max_length": 64,  # Shorter max_length for more focused questions
+    "num_beams": 4,
+    "length_penalty": 1.0,
+    "early_stopping": True,
+    "no_repeat_ngram_size": 2  # Prevent repetition
+}
+QA_PARAMS = {"max_seq_length": 384, "doc_stride": 128, "max_answer_len": 50}
+# Chunk token limits: the T5 input minus the prompt and <hl> markers, and a single
+# RoBERTa window minus the longest generated question and special tokens
+QG_CHUNK_TOKENS = 512 - 16
+QA_CHUNK_TOKENS = QA_PARAMS["max_seq_length"] - QG_GENERATION_PARAMS["max_length"] - 4
+CHUNK_SHUFFLE_BUFFER = 64
+MAX_CHUNKS = 100  # Chunks visited per generation run at most
+IN_FLIGHT_BATCHES = 2  # Batches handed to the pipeline ahead of their outcomes
+TOPIC_SPREAD_CHUNKS = 2 * MAX_CHUNKS  # Chunks ordered by topic spread; the rest stay shuffled
+MIN_GAMES_FOR_TOP_UP = 2  # Only refill banks of documents that are played again
+CHUNK_CACHE_KEY = "chunk_cache"
+CHUNK_STORE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'chunk_store')
+CHUNK_STORE_MAX_BYTES = int(os.getenv('QG_CHUNK_STORE_MAX_BYTES', str(1024 * 1024 * 1024)))
+CHUNK_STORE_TTL = float(os.getenv('QG_CHUNK_STORE_TTL', str(30 * 24 * 3600)))
+_chunk_store_builds = set()  # Store paths being built in the background by this process
+_chunk_store_builds_lock = threading.Lock()
+QG_PROMPT_PREFIX = "generate question:"
+
+def get_chunk_cache() -> DiskLRUCache:
+    """Return the process-wide cache of per-chunk stage outputs, or None if disabled."""
+    if CHUNK_CACHE_KEY not in MODEL_CACHE:
+        if os.getenv('QG_CHUNK_CACHE', '1') == '0':
+            MODEL_CACHE[CHUNK_CACHE_KEY] = None
+        else:
+            MODEL_CACHE[CHUNK_CACHE_KEY] = DiskLRUCache(
+                os.path.join(DEFAULT_CACHE_DIR, 'chunks'),
+                max_bytes=int(os.getenv('QG_CHUNK_CACHE_MAX_BYTES', str(256 * 1024 * 1024))),
+                s3_prefix=os.getenv('QG_CHUNK_CACHE_S3_PREFIX')  # e.g. "cache/chunks/"
+            )
+    return MODEL_CACHE[CHUNK_CACHE_KEY]
 
 def get_model(model_name: str):
-    """Cache and return models to prevent reloading."""
+    """Cache and return models to prevent reloading.
+
+    Tokenizers are shared by every thread in the process, so they come wrapped in
+    a `LockedTokenizer`.
+    """
     if model_name not in MODEL_CACHE:
         if 't5' in model_name.lower():
             MODEL_CACHE[model_name] = (
                 T5ForConditionalGeneration.from_pretrained(model_name).eval(),
-                T5TokenizerFast.from_pretrained(model_name)
+                LockedTokenizer(T5TokenizerFast.from_pretrained(model_name))
             )
         else:
             MODEL_CACHE[model_name] = (
                 AutoModelForQuestionAnswering.from_pretrained(model_name).eval(),
-                AutoTokenizer.from_pretrained(model_name)
+                LockedTokenizer(AutoTokenizer.from_pretrained(model_name))
             )
     return MODEL_CACHE[model_name]
 
@@ -75,199 +135,656 @@ def clean_context(context: str) -> str:
     """Clean the input context."""
     return "".join(context).replace("▁", " ").replace("", "").strip() if isinstance(context, list) else context.strip()
 
-@torch.no_grad()  # Disable gradient calculations for inference
-def generate_question(context: str, model, tokenizer, max_length: int = 512) -> str:
-    """Generate a question using T5 model."""
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    
-    inputs = tokenizer(
-        f"generate question: {context}",
-        return_tensors="pt",
-        max_length=max_length,
-        truncation=True,
-        padding="max_length"
-    ).to(device)
-
-    outputs = model.generate(
-        input_ids=inputs.input_ids,
-        attention_mask=inputs.attention_mask,
-        max_length=64,  # Shorter max_length for more focused questions
-        num_beams=4,
-        length_penalty=1.0,
-        early_stopping=True,
-        no_repeat_ngram_size=2  # Prevent repetition
-    )
-    
-    return tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+def prompt_ids(context_ids, prefix_ids: List[int], tokenizer, max_length: int = 512) -> List[int]:
+    """T5 input ids of the question prompt for an already tokenized context."""
+    ids = (list(prefix_ids) + [int(t) for t in context_ids])[:max_length - tokenizer.num_special_tokens_to_add()]
+    return tokenizer.build_inputs_with_special_tokens(ids)
+
+@torch.no_grad()
+def generate_questions(contexts: List[str], model, tokenizer, batch_size: int = 8, max_length: int = 512,
+                       context_ids: List = None) -> List[str]:
+    """Generate one question per context, batching inputs of similar length together.
+
+    Contexts are sorted by token length and split into buckets of `batch_size`, so
+    each bucket is only padded to its longest item instead of to `max_length`.
+    Questions are returned in the same order as `contexts`. `context_ids` may
+    give each context's T5 ids from a chunk store (or None to tokenize it here).
+    """
+    if not contexts:
+        return []
+
+    device = next(model.parameters()).device
+    prompts = [f"{QG_PROMPT_PREFIX} {context}" for context in contexts]
+
+    # Tokenize once without padding to get the true length of each prompt
+    encoded = [None] * len(prompts)
+    if context_ids and any(ids is not None for ids in context_ids):
+        prefix_ids = tokenizer(QG_PROMPT_PREFIX, add_special_tokens=False)["input_ids"]
+        for i, ids in enumerate(context_ids):
+            if ids is not None:
+                encoded[i] = prompt_ids(ids, prefix_ids, tokenizer, max_length)
+    rest = [i for i, ids in enumerate(encoded) if ids is None]
+    if rest:
+        for i, ids in zip(rest, tokenizer([prompts[i] for i in rest], max_length=max_length, truncation=True)["input_ids"]):
+            encoded[i] = ids
+    order = sorted(range(len(prompts)), key=lambda i: len(encoded[i]))
 
-def extract_best_answer(question: str, context: str, qa_pipeline, max_context_length: int = 384) -> tuple:
-    """Extract the best possible answer."""
+    questions = [""] * len(prompts)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        inputs = tokenizer.pad(
+            {"input_ids": [encoded[i] for i in bucket]},
+            padding="longest",
+            return_tensors="pt"
+        ).to(device)
+
+        outputs = model.generate(
+            input_ids=inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            **QG_GENERATION_PARAMS
+        )
+
+        decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        for i, question in zip(bucket, decoded):
+            questions[i] = question.strip()
+
+    return questions
+
+def chunk_budgets(models: Dict) -> List[tuple]:
+    """(tokenizer, max tokens) limits every chunk must fit for the QG and QA models."""
+    return [(models['qg_tokenizer'], QG_CHUNK_TOKENS), (models['qa_tokenizer'], QA_CHUNK_TOKENS)]
+
+def chunk_store_path(doc_hash: str) -> str:
+    """Where the chunk store of a document lives for the current models and chunk budgets."""
+    version = make_key(QG_MODEL_NAME, QA_MODEL_NAME, QG_CHUNK_TOKENS, QA_CHUNK_TOKENS, MIN_PARAGRAPH_LENGTH)
+    return os.path.join(CHUNK_STORE_DIR, f"{doc_hash}_{version[:12]}")
+
+def build_chunk_store(input_file: str, models: Dict, path: str) -> ChunkStore:
+    """Chunk and tokenize a document into a store at `path` and precompute its chunk scores and embeddings.
+
+    Returns None if the document has no usable chunks. Old stores are evicted afterwards.
+    """
+    store = ChunkStore.build(iter_chunks(input_file, chunk_budgets(models)),
+                             models['qg_tokenizer'], models['qa_tokenizer'])
+    if len(store) == 0:
+        return None
+    if store.save(path):
+        logger.info(f"Saved {len(store)} chunks to chunk store {path}")
+    store = ChunkStore.load(path) if ChunkStore.exists(path) else store
+    # Computes and saves the features and embeddings the next game orders chunks by
+    scored_order(store, random.Random())
+    chunk_store.evict(CHUNK_STORE_DIR, CHUNK_STORE_MAX_BYTES, CHUNK_STORE_TTL)
+    return store
+
+def _build_chunk_store_in_background(source_copy: str, models: Dict, path: str):
     try:
-        truncated_context = context[:max_context_length]
-        results = qa_pipeline(question=question, context=truncated_context, top_k=3, max_answer_len=50)
-        
-        if results:
-            best_result = max(results, key=lambda x: x.get("score", 0.0))
-            return best_result.get("answer", "No answer found"), best_result.get("score", 0.0)
-        return "No valid answers found", 0.0
+        build_chunk_store(source_copy, models, path)
+    except Exception as e:
+        logger.error(f"Failed to build chunk store {path}: {str(e)}")
+    finally:
+        with _chunk_store_builds_lock:
+            _chunk_store_builds.discard(path)
+        try:
+            os.remove(source_copy)
+        except OSError:
+            pass
+
+def get_chunk_store(input_file: str, models: Dict, doc_hash: str = None, wait: bool = False) -> ChunkStore:
+    """Open the document's chunk store, or start building it.
+
+    Without a store, it is built on a background thread from a copy of the file
+    and None is returned, so the current game streams chunks from the file
+    straight away and later games use the store. The build shares the models'
+    tokenizers, which serialize their calls (see `LockedTokenizer`). With `wait` it is built here
+    instead. Also returns None if the store is disabled (QG_CHUNK_STORE=0), fails,
+    or the document has no usable chunks.
+    """
+    if os.getenv('QG_CHUNK_STORE', '1') == '0':
+        return None
+    path = chunk_store_path(doc_hash or document_hash(input_file))
+    try:
+        if ChunkStore.exists(path):
+            store = ChunkStore.load(path)
+            logger.info(f"Loaded {len(store)} chunks from chunk store {path}")
+            return store
+        if wait:
+            return build_chunk_store(input_file, models, path)
+
+        with _chunk_store_builds_lock:
+            if path in _chunk_store_builds:
+                return None
+            _chunk_store_builds.add(path)
+        try:
+            # The caller deletes its input file when the game ends, so build from a copy
+            os.makedirs(CHUNK_STORE_DIR, exist_ok=True)
+            source_copy = f"{path}.tmp{os.getpid()}.txt"
+            shutil.copyfile(input_file, source_copy)
+            # A daemon, so one-shot runs exit when their game is done; the store is saved
+            # before scoring, and anything left half-built is cleared by `chunk_store.evict`
+            threading.Thread(target=_build_chunk_store_in_background, args=(source_copy, models, path),
+                             name="chunk-store-build", daemon=True).start()
+        except Exception:
+            with _chunk_store_builds_lock:
+                _chunk_store_builds.discard(path)
+            raise
+        logger.info(f"Building chunk store {path} in the background")
+        return None
     except Exception as e:
-        print(f"Error extracting answer: {str(e)}")
-        return f"Error extracting answer: {str(e)}", 0.0
+        logger.error(f"Chunk store unavailable, streaming chunks instead: {str(e)}")
+        return None
+
+def game_rng(seed_text: str) -> random.Random:
+    """Random generator seeded from the given text and the current time, so every game differs."""
+    return random.Random(hash(seed_text + str(datetime.datetime.now().timestamp())))
 
-def load_and_tokenize_text(input_file: str, min_paragraph_length: int = 200, max_paragraph_length: int = 1000) -> List[str]:
-    """Load and split text by paragraphs for more natural chunking."""
+def chunk_embeddings(store: ChunkStore):
+    """Sentence embeddings of the store's chunks, or None if disabled (QG_CHUNK_DIVERSITY=0) or failing."""
+    if os.getenv('QG_CHUNK_DIVERSITY', '1') == '0':
+        return None
     try:
-        with open(input_file, "r", encoding="utf-8") as file:
-            text = file.read()
-            
-        print(f"Loaded text with {len(text)} characters")
-        
-        # Clean up formatting artifacts
-        # Remove page headers/footers and other formatting artifacts
-        text = re.sub(r'\d+\s+Science\s+\d+-\d+\s+Ch\d+\.qxd\s+\d+/\d+/\d+\s+\d+:\d+\s+Page\s+\d+', '', text)
-        
-        # Split text into paragraphs
-        paragraphs = re.split(r'\n\s*\n', text)
-        
-        # Filter out short paragraphs, page numbers, and other artifacts
-        valid_paragraphs = []
-        for p in paragraphs:
-            p = p.strip()
-            # Skip short paragraphs
-            if len(p) < min_paragraph_length:
-                continue
-                
-            # Skip paragraphs that are likely page numbers or headers
-            if re.match(r'^\d+$', p) or re.match(r'^Chapter \d+', p):
-                continue
-                
-            # Skip paragraphs with too many numbers or special characters
-            if sum(c.isdigit() or c in '/:.-' for c in p) / len(p) > 0.3:
-                continue
-            
-            # If paragraph is too long, split it into smaller chunks
-            if len(p) > max_paragraph_length:
-                # Try to split on sentences
-                sentences = re.split(r'(?<=[.!?])\s+', p)
-                current_chunk = ""
-                
-                for sentence in sentences:
-                    if len(current_chunk) + len(sentence) <= max_paragraph_length:
-                        current_chunk += sentence + " "
-                    else:
-                        if current_chunk:
-                            valid_paragraphs.append(current_chunk.strip())
-                        current_chunk = sentence + " "
-                
-                # Add the last chunk if it exists
-                if current_chunk and len(current_chunk) >= min_paragraph_length:
-                    valid_paragraphs.append(current_chunk.strip())
-            else:
-                valid_paragraphs.append(p)
-        
-        print(f"Split text into {len(valid_paragraphs)} paragraphs")
-        return valid_paragraphs
+        return get_chunk_embeddings(store, distractor_generator.model, distractor_generator.SENTENCE_MODEL_NAME)
     except Exception as e:
-        print(f"Error loading text: {str(e)}")
-        traceback.print_exc()
-        return []
+        logger.error(f"Chunk embeddings unavailable, not spreading chunks by topic: {str(e)}")
+        return None
 
-@torch.no_grad()
-def process_chunk(chunk: str, models: Dict) -> Dict:
-    """Process a single chunk to generate a QA pair."""
+def scored_order(store: ChunkStore, rng: random.Random) -> List[int]:
+    """Store chunk indices, best-scoring first and spread by topic, or None if scoring is off or fails."""
+    if os.getenv('QG_CHUNK_SCORING', '1') == '0':
+        return None
     try:
-        context = clean_context(chunk)
+        return visit_order(get_chunk_scores(store, s2v, S2V_NAME), rng, embeddings=chunk_embeddings(store),
+                           spread_limit=TOPIC_SPREAD_CHUNKS)
+    except Exception as e:
+        logger.error(f"Chunk scoring failed, visiting chunks at random: {str(e)}")
+        return None
+
+def make_scheduler(store: ChunkStore, num_questions: int, seed_text: str, batch_size: int = 8,
+                   max_chunks: int = MAX_CHUNKS) -> RegionScheduler:
+    """Adaptive visiting order over a chunk store, or None without a store (or with QG_CHUNK_SCHEDULER=0).
+
+    At most IN_FLIGHT_BATCHES batches of chunks are handed out ahead of their
+    outcomes, enough to keep the pipeline stages overlapping.
+    """
+    if store is None or os.getenv('QG_CHUNK_SCHEDULER', '1') == '0':
+        return None
+    rng = game_rng(seed_text)
+    order = scored_order(store, rng)
+    if order is None:
+        order = list(range(len(store)))
+        rng.shuffle(order)
+    return RegionScheduler(order, num_questions, max_chunks, rng=rng, max_in_flight=IN_FLIGHT_BATCHES * batch_size)
+
+def stream_chunks(input_file: str, models: Dict, seed_text: str, max_chunks: int = MAX_CHUNKS,
+                  buffer_size: int = CHUNK_SHUFFLE_BUFFER, store: ChunkStore = None,
+                  scheduler: RegionScheduler = None) -> Iterator[tuple]:
+    """Lazily yield up to `max_chunks` (chunk index, chunk) pairs in a random visiting order.
+
+    Reading starts at a random paragraph and wraps around the file, and a
+    shuffle buffer mixes nearby chunks, so the first questions don't all come
+    from the start of the document. With a chunk `store` the chunks come from
+    the store instead and keep their store index. They are picked by the
+    `scheduler` if given, else visited best-scoring first (QG_CHUNK_SCORING=0
+    disables this) or from a random chunk onwards.
+    """
+    if store is not None and scheduler is not None:
+        return ((i, store.text(i)) for i in scheduler)
+
+    rng = game_rng(seed_text)
+    if store is not None:
+        order = scored_order(store, rng)
+        if order is not None:
+            return itertools.islice(((i, store.text(i)) for i in order), max_chunks)
+        start = rng.randrange(len(store))
+        order = itertools.chain(range(start, len(store)), range(start))
+        chunks = ((i, store.text(i)) for i in order)
+    else:
+        start_offset = rng.randrange(max(1, os.path.getsize(input_file)))
+        chunks = enumerate(iter_chunks(input_file, chunk_budgets(models), start_offset=start_offset))
+    return itertools.islice(shuffle_buffer(chunks, buffer_size, rng), max_chunks)
+
+def validate_question(question: str):
+    """Reject questions that are too short or invalid."""
+    if not question or len(question) < 10:
+        raise ChunkRejected(chunk_scheduler.INVALID_QUESTION, f"Generated invalid question: {question}")
+
+def validate_answer(best_answer: str, score: float):
+    """Reject low-confidence, missing or overly long answers."""
+    if score < 0.3:
+        raise ChunkRejected(chunk_scheduler.LOW_CONFIDENCE, f"Answer confidence too low: {score:.2f}")
         
-        # Skip chunks that are too short
-        if len(context) < 200:
-            raise ValueError(f"Chunk too short: {len(context)} characters")
-            
-        question = generate_question(context, models['qg_model'], models['qg_tokenizer'])
+    if not best_answer:
+        raise ChunkRejected(chunk_scheduler.NO_ANSWER, "No answer found")
         
-        # Skip if question is too short or invalid
-        if not question or len(question) < 10:
-            raise ValueError(f"Generated invalid question: {question}")
-            
-        print(f"Generated question: {question}")
+    if len(best_answer.split()) > 10:
+        raise ChunkRejected(chunk_scheduler.ANSWER_TOO_LONG, f"Answer too long: {len(best_answer.split())} words")
+
+def cached_multiple_choice_batch(items: List[Tuple[str, str, str]], cache: DiskLRUCache = None) -> List:
+    """`create_multiple_choice_batch`, memoized by (question, answer, context) when a cache is given.
+
+    Only successes are cached: a failure may be transient (e.g. S3 or an index
+    not loaded yet) and is retried next time. Options are reshuffled on every
+    hit so games don't share an answer position. Returns the question dict or
+    ValueError for each (question, answer, context).
+    """
+    if cache is None:
+        return create_multiple_choice_batch(items)
+
+    keys = [make_key("multiple_choice", DISTRACTOR_MODEL_VERSION, question, best_answer, context)
+            for question, best_answer, context in items]
+    results = []
+    for key in keys:
+        cached = cache.get(key)
+        if cached is None:
+            results.append(None)
+        else:
+            options = list(cached['options'])
+            random.shuffle(options)
+            results.append({**cached, "options": options})
 
-        best_answer, score = extract_best_answer(question, context, models['qa_pipeline'])
-        print(f"Generated answer: {best_answer} (confidence: {score:.2f})")
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        for i, mc_question in zip(misses, create_multiple_choice_batch([items[i] for i in misses])):
+            results[i] = mc_question
+            if not isinstance(mc_question, ValueError):
+                cache.put(keys[i], mc_question)
+    return results
 
-        if score < 0.3:
-            raise ValueError(f"Answer confidence too low: {score:.2f}")
+def build_qa_pair(question: str, best_answer: str, score: float, context: str, mc_question) -> Dict:
+    """Create the final QA pair for an accepted answer.
+
+    `mc_question` is the answer's result from `cached_multiple_choice_batch`.
+    """
+    try:
+        if isinstance(mc_question, Exception):
+            raise mc_question
+        if not mc_question:
+            raise ValueError("Failed to create multiple choice question")
             
-        if not best_answer:
-            raise ValueError("No answer found")
+        if 'options' not in mc_question:
+            raise ValueError("Multiple choice question missing options")
             
-        if len(best_answer.split()) > 10:
-            raise ValueError(f"Answer too long: {len(best_answer.split())} words")
+        if len(mc_question['options']) < 3:
+            raise ValueError(f"Not enough options: {len(mc_question['options'])}")
             
-        try:
-            mc_question = create_multiple_choice(question, best_answer, context)
-            if not mc_question:
-                raise ValueError("Failed to create multiple choice question")
-                
-            if 'options' not in mc_question:
-                raise ValueError("Multiple choice question missing options")
-                
-            if len(mc_question['options']) < 3:
-                raise ValueError(f"Not enough options: {len(mc_question['options'])}")
-                
-            # Highlight the answer in the context
-            highlighted_context = context
-            if best_answer in highlighted_context:
-                highlighted_context = highlighted_context.replace(
-                    best_answer, 
-                    f"**{best_answer}**"  # Bold the answer in the context
+        # Highlight the answer in the context
+        highlighted_context = context
+        if best_answer in highlighted_context:
+            highlighted_context = highlighted_context.replace(
+                best_answer, 
+                f"**{best_answer}**"  # Bold the answer in the context
+            )
+        
+        return {
+            "question": mc_question['question'],
+            "options": mc_question['options'],
+            "correct_answer": mc_question['answer'],
+            "context": highlighted_context[:1500],  # Include more context with highlighting
+            "answer_confidence": float(score)
+        }
+    except Exception as e:
+        logger.error(f"Error generating distractors: {str(e)}")
+        logger.error(f"Question: {question}")
+        logger.error(f"Answer: {best_answer}")
+        logger.error(f"Context: {context[:200]}...")  # Log first 200 chars of context
+        raise ChunkRejected(chunk_scheduler.NO_DISTRACTORS, f"Failed to create multiple choice question: {str(e)}")
+
+def make_question_deduper(served: List[Dict] = ()) -> QuestionDeduper:
+    """Near-duplicate question filter seeded with the QA pairs already `served` to the game.
+
+    Returns None if disabled (QG_QUESTION_DEDUP=0). Questions are encoded with the
+    sentence model directly, so they don't evict distractor phrase embeddings.
+    """
+    if os.getenv('QG_QUESTION_DEDUP', '1') == '0':
+        return None
+    deduper = QuestionDeduper(lambda questions: distractor_generator.model.encode(questions, batch_size=max(1, len(questions))))
+    try:
+        deduper.add([qa_pair['question'] for qa_pair in served])
+    except Exception as e:
+        logger.error(f"Failed to seed question deduper with served questions: {str(e)}")
+    return deduper
+
+def make_pipeline_stages(models: Dict, batch_size: int, answer_first: bool = False,
+                         cache: DiskLRUCache = None, store: ChunkStore = None, on_outcome=None,
+                         deduper: QuestionDeduper = None) -> List:
+    """Build the QG -> QA -> distractor stages for `StagedPipeline`.
+
+    The first stage takes a batch of (position, chunk index, chunk) tuples and
+    passes the surviving questions on as a batch; the last stage yields one
+    (chunk index, QA pair) per accepted question. Questions and answers are
+    checked with `validate_question` and `validate_answer`.
+
+    With `answer_first`, candidate answers are highlighted in each chunk and
+    several questions are generated per chunk in the same batched call. Those
+    questions keep their answer, and their confidence is the QA model's score if
+    it finds that answer from the question (0 otherwise), like extracted ones.
+
+    With a `cache`, each stage's output is memoized by its inputs and the model
+    and generation settings, so repeated chunks skip the models entirely.
+
+    Questions whose answer gets no Sense2Vec distractors fall back to phrases
+    from the document's own chunks (disable with QG_DOCUMENT_DISTRACTORS=0).
+
+    With a chunk `store`, chunk indices refer to it and the T5 and RoBERTa
+    stages use its token ids instead of tokenizing the chunks again.
+
+    `on_outcome(chunk index, reason)` is called for every rejected question with
+    its `chunk_scheduler` reason code.
+
+    Questions that are near-duplicates (by embedding) of one already produced in
+    this run, or seen by the given `deduper`, are dropped before the distractor
+    stage (disable with QG_QUESTION_DEDUP=0).
+    """
+    def rejected(item, error):
+        logger.error(f"Failed to process chunk {item['position']+1}: {str(error)}")
+        if on_outcome:
+            on_outcome(item['chunk_idx'], rejection_reason(error))
+
+    doc_phrases = DocumentPhraseTable() if os.getenv('QG_DOCUMENT_DISTRACTORS', '1') != '0' else None
+    if deduper is None:
+        deduper = make_question_deduper()
+
+    @torch.no_grad()
+    def question_stage(batch):
+        prompts = []
+        for i, chunk_idx, chunk in batch:
+            context = clean_context(chunk)
+            candidates = select_answer_candidates(context) if answer_first else []
+            for start, end, answer in candidates:
+                prompts.append(({"position": i, "chunk_idx": chunk_idx, "context": context,
+                                 "answer": answer},
+                                build_highlight_prompt(context, start, end), None))
+            if not candidates:
+                prompts.append(({"position": i, "chunk_idx": chunk_idx, "context": context}, context,
+                                store.qg_ids(chunk_idx) if store is not None else None))
+            # Every visited chunk feeds the document distractor fallback
+            if doc_phrases is not None:
+                doc_phrases.queue_texts([context])
+
+        keys = [make_key("question", QG_MODEL_NAME, QG_GENERATION_PARAMS, prompt) for _, prompt, _ in prompts]
+        questions = [cache.get(key) if cache else None for key in keys]
+        misses = [i for i, question in enumerate(questions) if question is None]
+
+        if misses:
+            logger.info(f"Generating {len(misses)} questions for {len(batch)} chunks in one batch")
+            try:
+                generated = generate_questions([prompts[i][1] for i in misses], models['qg_model'],
+                                               models['qg_tokenizer'], batch_size=batch_size,
+                                               context_ids=[prompts[i][2] for i in misses])
+            except Exception as e:
+                logger.error(f"Failed to generate questions for batch: {str(e)}")
+                if on_outcome:
+                    for _, chunk_idx, _ in batch:
+                        on_outcome(chunk_idx, chunk_scheduler.ERROR)
+                return []
+            for i, question in zip(misses, generated):
+                questions[i] = question
+                if cache:
+                    cache.put(keys[i], question)
+
+        items = []
+        for (item, _, _), question in zip(prompts, questions):
+            try:
+                validate_question(question)
+                print(f"Generated question: {question}")
+                items.append({**item, "question": question})
+            except ValueError as e:
+                rejected(item, e)
+        return [items] if items else []
+
+    @torch.no_grad()
+    def answer_stage(items):
+        keys = [make_key("answer", QA_MODEL_NAME, QA_PARAMS, item['question'], item['context']) for item in items]
+        answers = [cache.get(key) if cache else None for key in keys]
+        misses = [i for i, answer in enumerate(answers) if answer is None]
+
+        if misses:
+            extracted = extract_best_answers(
+                [(items[i]['question'], items[i]['context']) for i in misses],
+                models['qa_model'], models['qa_tokenizer'], batch_size=batch_size, **QA_PARAMS,
+                context_ids=[(store.qa_ids(items[i]['chunk_idx']), store.qa_spans(items[i]['chunk_idx']))
+                             if store is not None else None for i in misses]
+            )
+            for i, answer in zip(misses, extracted):
+                answers[i] = answer
+                if cache and not answer[0].startswith("Error extracting answer"):
+                    cache.put(keys[i], list(answer))
+
+        accepted = []
+        for item, (best_answer, score) in zip(items, answers):
+            if 'answer' in item:
+                # Answer-first: keep the chosen answer, scored by whether QA finds it too
+                if not answer_matches(item['answer'], best_answer):
+                    score = 0.0
+                best_answer = item['answer']
+            print(f"Generated answer: {best_answer} (confidence: {score:.2f})")
+            try:
+                validate_answer(best_answer, score)
+                accepted.append({**item, "answer": best_answer, "score": score})
+            except ValueError as e:
+                rejected(item, e)
+        return [accepted] if accepted else []
+
+    def distractor_stage(items):
+        if deduper is not None:
+            try:
+                kept = set(deduper.filter([item['question'] for item in items]))
+            except Exception as e:
+                logger.error(f"Question deduplication failed: {str(e)}")
+                kept = set(range(len(items)))
+            for i, item in enumerate(items):
+                if i not in kept:
+                    rejected(item, ChunkRejected(chunk_scheduler.DUPLICATE,
+                                                 f"Near-duplicate of an earlier question: {item['question']}"))
+            items = [item for i, item in enumerate(items) if i in kept]
+            if not items:
+                return
+
+        # Distractors for the whole batch are generated together
+        mc_questions = cached_multiple_choice_batch(
+            [(item['question'], item['answer'], item['context']) for item in items], cache
+        )
+        # Salvage failed questions with distractors drawn from the document itself
+        failed = [i for i, mc_question in enumerate(mc_questions) if isinstance(mc_question, ValueError)]
+        if failed and doc_phrases is not None:
+            try:
+                salvaged = doc_phrases.create_multiple_choice_batch(
+                    [(items[i]['question'], items[i]['answer'], items[i]['context']) for i in failed]
                 )
-            
-            return {
-                "question": mc_question['question'],
-                "options": mc_question['options'],
-                "correct_answer": mc_question['answer'],
-                "context": highlighted_context[:1500],  # Include more context with highlighting
-                "answer_confidence": float(score)
-            }
-        except Exception as e:
-            logger.error(f"Error generating distractors: {str(e)}")
-            logger.error(f"Question: {question}")
-            logger.error(f"Answer: {best_answer}")
-            logger.error(f"Context: {context[:200]}...")  # Log first 200 chars of context
-            raise ValueError(f"Failed to create multiple choice question: {str(e)}")
-            
+            except Exception as e:
+                logger.error(f"Document distractor fallback failed: {str(e)}")
+                salvaged = []
+            for i, mc_question in zip(failed, salvaged):
+                if not isinstance(mc_question, ValueError):
+                    logger.info(f"Using document distractors for answer: {items[i]['answer']}")
+                    mc_questions[i] = mc_question
+        for item, mc_question in zip(items, mc_questions):
+            try:
+                qa_pair = build_qa_pair(item['question'], item['answer'], item['score'], item['context'], mc_question)
+            except ValueError as e:
+                rejected(item, e)
+                if deduper is not None:
+                    deduper.discard([item['question']])
+                continue
+            if deduper is not None:
+                deduper.add([item['question']])
+            yield item['chunk_idx'], qa_pair
+
+    return [question_stage, answer_stage, distractor_stage]
+
+def load_models(on_loaded=None) -> Dict:
+    """Load (or fetch from MODEL_CACHE) the models used for question generation.
+
+    `on_loaded(message, step)` is called after each model is ready so callers can
+    report progress. In a long-lived worker every call after the first is free.
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    logger.info(f"Using device: {device}")
+
+    try:
+        logger.info("Loading T5 model...")
+        qg_model, qg_tokenizer = get_model(QG_MODEL_NAME)
+        qg_model = qg_model.to(device)
+        logger.info("Successfully loaded T5 model")
+        if on_loaded:
+            on_loaded("T5 model loaded successfully...", 1)
     except Exception as e:
-        logger.error(f"Error in process_chunk: {str(e)}")
-        logger.error(f"Chunk: {chunk[:200]}...")  # Log first 200 chars of chunk
-        raise ValueError(f"Failed to process chunk: {str(e)}")
+        logger.error(f"Failed to load T5 model: {str(e)}")
+        raise
+
+    try:
+        logger.info("Loading RoBERTa model...")
+        qa_model, qa_tokenizer = get_model(QA_MODEL_NAME)
+        qa_model = qa_model.to(device)
+        logger.info("Successfully loaded RoBERTa model")
+        if on_loaded:
+            on_loaded("RoBERTa model loaded successfully...", 2)
+    except Exception as e:
+        logger.error(f"Failed to load RoBERTa model: {str(e)}")
+        raise
+
+    return {
+        'qg_model': qg_model,
+        'qg_tokenizer': qg_tokenizer,
+        'qa_model': qa_model,
+        'qa_tokenizer': qa_tokenizer
+    }
+
+def generate_qa_pairs(ordered_chunks: Iterable[tuple], models: Dict, num_questions: int, batch_size: int = 8,
+                      answer_first: bool = False, is_active=None, accept=None, on_question=None,
+                      store: ChunkStore = None, scheduler: RegionScheduler = None,
+                      deduper: QuestionDeduper = None) -> List[Dict]:
+    """Run chunks through the QG -> QA -> distractor pipeline until `num_questions` are accepted.
+
+    `ordered_chunks` yields (chunk index, chunk) pairs in visiting order; it is
+    consumed lazily, one batch at a time. Pass the chunk `store` the indices
+    refer to, if any, so its token ids are used, and the `scheduler` producing
+    them, if any, so it learns from every question's outcome. A `deduper` (see
+    `make_question_deduper`) carries questions the game already has, e.g. from
+    the question bank.
+    `is_active()` is checked before each batch, `accept(qa_pair)` can reject a
+    finished pair (e.g. one already in the question bank) and
+    `on_question(qa_pairs)` is called after each accepted pair. Returns None if
+    `is_active` reported that the work is no longer needed.
+    """
+    cancelled = False
+    on_outcome = scheduler.record if scheduler else None
+
+    def chunk_batches():
+        """Yield batches of unprocessed chunks, stopping if the work is no longer needed."""
+        nonlocal cancelled
+        processed_chunks = set()  # Keep track of processed chunks to avoid duplicates
+        chunks = iter(ordered_chunks)
+        position = 0
+
+        for raw_batch in iter(lambda: list(itertools.islice(chunks, batch_size)), []):
+            # Check if game still exists before processing each batch
+            if is_active and not is_active():
+                cancelled = True
+                return
+
+            batch = []
+            for chunk_idx, chunk in raw_batch:
+                i = position
+                position += 1
+                if chunk_idx in processed_chunks:
+                    continue
+                processed_chunks.add(chunk_idx)
+
+                # Skip chunks that are too short before paying for a T5 pass
+                if len(clean_context(chunk)) < 200:
+                    logger.error(f"Failed to process chunk {i+1}: Chunk too short")
+                    if on_outcome:
+                        on_outcome(chunk_idx, chunk_scheduler.CHUNK_TOO_SHORT)
+                    continue
+                batch.append((i, chunk_idx, chunk))
+
+            if batch:
+                yield batch
+
+    qa_pairs = []
+    # QG, QA and distractor generation run as overlapping stages
+    stages = make_pipeline_stages(models, batch_size, answer_first, get_chunk_cache(), store, on_outcome, deduper)
+    with StagedPipeline(chunk_batches(), stages) as pipeline:
+        try:
+            for chunk_idx, qa_pair in pipeline:
+                if accept and not accept(qa_pair):
+                    logger.info(f"Skipping question already in the bank: {qa_pair['question']}")
+                    if on_outcome:
+                        on_outcome(chunk_idx, chunk_scheduler.DUPLICATE)
+                    continue
+                if on_outcome:
+                    on_outcome(chunk_idx)
+                qa_pairs.append(qa_pair)
+                logger.info(f"Created multiple choice question {len(qa_pairs)} of {num_questions}")
+                if on_question:
+                    on_question(qa_pairs)
+
+                if len(qa_pairs) >= num_questions or cancelled:
+                    break
+        finally:
+            if scheduler:
+                # Release the pipeline source if it is waiting for outcomes
+                scheduler.close()
+
+    if scheduler:
+        logger.info(f"Chunk outcomes: {scheduler.summary()}")
+    return None if cancelled else qa_pairs
+
+def publish_questions(qa_pairs: List[Dict], game_code: str, num_questions: int, output_path: str,
+                      stream: QuestionStream = None):
+    """Upload the game's questions to S3 and mark generation as completed."""
+    # Save questions to temporary file first
+    logger.info(f"Saving {len(qa_pairs)} questions to temporary file")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"questions": qa_pairs}, f, indent=2)
+
+    # Upload questions to S3 directly (no permanent local storage)
+    write_json_to_s3({"questions": qa_pairs}, f'questions/{game_code}/questions.json')
+    if stream:
+        stream.finish()
+
+    # Final status update - 100% complete
+    update_status({
+        "status": "completed",
+        "message": f"Successfully generated {len(qa_pairs)} questions",
+        "progress": 100,
+        "total_questions": num_questions,
+        "questions_generated": len(qa_pairs),
+        "questions_ready": len(qa_pairs),
+        "first_questions_ready": True
+    }, game_code)
+
+def run_generation(game_code: str, num_questions: int, batch_size: int = 8, source_key: str = None,
+                   answer_first: bool = False, use_bank: bool = True) -> List[Dict]:
+    """Generate questions for a game and upload them to S3.
+
+    Reads the transcript from `source_key` (defaults to the game's
+    combined_output.txt). Returns the generated QA pairs, or None if the game
+    stopped being active while questions were being generated. `answer_first`
+    generates several highlighted-answer questions per chunk.
+
+    With `use_bank`, unseen questions from the document's question bank are
+    served first and only the shortfall is generated.
+    """
+    use_bank = use_bank and os.getenv('QG_QUESTION_BANK', '1') != '0'
+    batch_size = max(1, batch_size)
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--num_questions', type=int, required=True)
-    parser.add_argument('--game_code', type=str, required=True)
-    args = parser.parse_args()
-    num_questions = args.num_questions
-    game_code = args.game_code
-    
     # Use temporary files instead of permanent local storage
     import tempfile
     temp_dir = tempfile.mkdtemp()
     
     paths = {
         'input': os.path.join(temp_dir, 'combined_output.txt'),  # Temporary file
-        'chunks': os.path.join(temp_dir, 'tokenized_chunks.json'),  # Temporary file
         'output': os.path.join(temp_dir, 'questions.json')  # Temporary file
     }
+    current_progress = 0
 
     try:
         # Download combined_output.txt from S3 to temporary file
-        s3_key = f"outputs/{game_code}/combined_output.txt"
+        s3_key = source_key or f"outputs/{game_code}/combined_output.txt"
         if not download_file(s3_key, paths['input']):
             raise FileNotFoundError(f"Could not download {s3_key} from S3. Transcript missing.")
 
-        # Set up logging
-        logging.basicConfig(level=logging.DEBUG)
-        logger = logging.getLogger(__name__)
-        
         # Get current status to maintain progress
         current_status = read_json_from_s3(f'status/{game_code}/status.json')
         current_progress = current_status.get('progress', 0) if current_status else 0
@@ -284,58 +801,44 @@ def main():
         
         logger.info("Starting question generation process")
 
-        # Load models with CUDA optimization
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        logger.info(f"Using device: {device}")
-        
-        try:
-            logger.info("Loading T5 model...")
-            qg_model, qg_tokenizer = get_model("valhalla/t5-base-qg-hl")
-            qg_model = qg_model.to(device)
-            logger.info("Successfully loaded T5 model")
-            
-            # Update status after T5 model is loaded - increment by 5%
-            update_status({
-                "status": "processing", 
-                "message": "T5 model loaded successfully...",
-                "progress": min(95, current_progress + 5),
-                "total_questions": num_questions,
-                "questions_generated": 0
-            }, game_code)
-            
-        except Exception as e:
-            logger.error(f"Failed to load T5 model: {str(e)}")
-            raise
+        # Questions are published one by one so the game can start early
+        stream = QuestionStream(game_code, num_questions)
 
-        try:
-            logger.info("Loading RoBERTa model...")
-            qa_pipeline = pipeline("question-answering", 
-                                 model="deepset/roberta-base-squad2",
-                                 device=0 if torch.cuda.is_available() else -1)
-            logger.info("Successfully loaded RoBERTa model")
-            
-            # Update status after RoBERTa model is loaded - increment by 5%
+        # Serve what we can from the document's question bank
+        doc_hash = document_hash(paths['input'])
+        bank = QuestionBank.load(doc_hash) if use_bank else None
+        banked = bank.sample(num_questions) if bank else []
+        remaining = num_questions - len(banked)
+        if banked:
+            logger.info(f"Took {len(banked)} questions from the question bank")
+            for qa_pair in banked:
+                stream.append(qa_pair)
+
+        if bank:
+            bank.games_served += 1
+        if remaining <= 0:
+            publish_questions(banked, game_code, num_questions, paths['output'], stream)
+            bank.save()
+            return banked
+
+        # Models are cached, so in a resident worker this only reports progress
+        def report_model_loaded(message, step):
+            # Update status after each model is loaded - increment by 5%
             update_status({
                 "status": "processing", 
-                "message": "RoBERTa model loaded successfully...",
-                "progress": min(95, current_progress + 10),
+                "message": message,
+                "progress": min(95, current_progress + 5 * step),
                 "total_questions": num_questions,
                 "questions_generated": 0
             }, game_code)
-            
-        except Exception as e:
-            logger.error(f"Failed to load RoBERTa model: {str(e)}")
-            raise
 
-        models = {
-            'qg_model': qg_model,
-            'qg_tokenizer': qg_tokenizer,
-            'qa_pipeline': qa_pipeline
-        }
+        models = load_models(on_loaded=report_model_loaded)
         
-        logger.info("Loading and tokenizing text...")
-        chunks = load_and_tokenize_text(paths['input'])
-        logger.info(f"Loaded {len(chunks)} text chunks")
+        # Chunks and token ids come from the document's chunk store; the first game on a
+        # document streams from the file while the store is built in the background
+        store = get_chunk_store(paths['input'], models, doc_hash)
+        scheduler = make_scheduler(store, remaining, game_code, batch_size)
+        ordered_chunks = stream_chunks(paths['input'], models, game_code, store=store, scheduler=scheduler)
         
         # Update status after text is loaded - increment by 5%
         update_status({
@@ -346,96 +849,55 @@ def main():
             "questions_generated": 0
         }, game_code)
         
-        # Save chunks for debugging (temporary file)
-        with open(paths['chunks'], "w", encoding="utf-8") as f:
-            json.dump(chunks[:50], f)  # Save first 50 chunks to avoid huge files
-
-        qa_pairs = []
-        
-        # Set a seed based on current time and game code for better randomization
-        random.seed(hash(game_code + str(datetime.datetime.now().timestamp())))
-        
-        random.shuffle(chunks)  # Randomize to get diverse questions
-        
-        # Create an index list and shuffle it to ensure better randomization
-        chunk_indices = list(range(len(chunks)))
-        random.shuffle(chunk_indices)  # Shuffle the indices
-        
-        # Additional randomization: sort chunks by a random key to break any file-order bias
-        chunks_with_random_keys = [(random.random(), i, chunks[i]) for i in range(len(chunks))]
-        chunks_with_random_keys.sort()  # Sort by random key
-        randomized_chunks = [chunk for _, _, chunk in chunks_with_random_keys]
-        
-        # Process more chunks to get more questions
-        max_chunks_to_process = min(100, len(chunks))
-        logger.info(f"Processing up to {max_chunks_to_process} chunks to generate {num_questions} questions")
+        logger.info(f"Processing up to {MAX_CHUNKS} chunks to generate {remaining} questions")
         
         # Calculate progress increment per question
         progress_per_question = (80 - (current_progress + 15)) / num_questions
         
-        processed_chunks = set()  # Keep track of processed chunks to avoid duplicates
-        
-        for i in range(max_chunks_to_process):
-            # Check if game still exists before processing each chunk
-            if not check_game_status(game_code):
-                return
+        def report_question(generated):
+            stream.append(generated[-1])
 
-            if len(qa_pairs) >= num_questions:
-                break
-            
-            # Use random index to get chunk, ensuring we don't process the same chunk twice    
-            chunk_idx = chunk_indices[i]
-            if chunk_idx in processed_chunks:
-                continue
-                
-            chunk = randomized_chunks[chunk_idx] if chunk_idx < len(randomized_chunks) else chunks[chunk_idx]
-            processed_chunks.add(chunk_idx)
-                
-            logger.info(f"Processing chunk {i+1}/{max_chunks_to_process} (index: {chunk_idx})")
-            try:
-                qa_pair = process_chunk(chunk, models)
-                if qa_pair:
-                    qa_pairs.append(qa_pair)
-                    logger.info(f"Created multiple choice question {len(qa_pairs)} of {num_questions}")
-                    
-                    # Update status after each successful question - progress from current to 95%
-                    progress = min(95, current_progress + 15 + (len(qa_pairs) * progress_per_question))
-                    update_status({
-                        "status": "processing", 
-                        "message": f"Generated {len(qa_pairs)} of {num_questions} questions...",
-                        "progress": int(progress),
-                        "total_questions": num_questions,
-                        "questions_generated": len(qa_pairs)
-                    }, game_code)
-            except Exception as e:
-                logger.error(f"Failed to process chunk {i+1}: {str(e)}")
-                continue
+            # Update status after each successful question - progress from current to 95%
+            done = len(banked) + len(generated)
+            progress = min(95, current_progress + 15 + (done * progress_per_question))
+            update_status({
+                "status": "processing", 
+                "message": f"Generated {done} of {num_questions} questions...",
+                "progress": int(progress),
+                "total_questions": num_questions,
+                "questions_generated": done,
+                "questions_ready": stream.ready,
+                "first_questions_ready": stream.first_questions_ready
+            }, game_code)
+
+        generated = generate_qa_pairs(
+            ordered_chunks, models, remaining, batch_size=batch_size, answer_first=answer_first,
+            is_active=lambda: check_game_status(game_code),
+            accept=(lambda qa_pair: not bank.contains(qa_pair)) if bank else None,
+            on_question=report_question, store=store, scheduler=scheduler,
+            deduper=make_question_deduper(banked)
+        )
+        if generated is None:
+            return None
+
+        qa_pairs = banked + generated
+        if bank and generated:
+            bank.add(generated, served=True)
 
         if not qa_pairs:
             raise ValueError("No questions were generated successfully")
 
-        # Save questions to temporary file first
-        logger.info(f"Saving {len(qa_pairs)} questions to temporary file")
-        with open(paths['output'], "w", encoding="utf-8") as f:
-            json.dump({"questions": qa_pairs}, f, indent=2)
-
-        # Upload questions to S3 directly (no permanent local storage)
-        write_json_to_s3({"questions": qa_pairs}, f'questions/{game_code}/questions.json')
+        publish_questions(qa_pairs, game_code, num_questions, paths['output'], stream)
+        if bank:
+            bank.save()
 
         # Clear CUDA cache
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
         gc.collect()
 
-        # Final status update - 100% complete
-        update_status({
-            "status": "completed",
-            "message": f"Successfully generated {len(qa_pairs)} questions",
-            "progress": 100,
-            "total_questions": num_questions,
-            "questions_generated": len(qa_pairs)
-        }, game_code)
         logger.info("Question generation completed successfully")
+        return qa_pairs
 
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
@@ -457,5 +919,62 @@ def main():
         except Exception as e:
             logger.warning(f"Failed to clean up temporary directory: {e}")
 
+def top_up_question_bank(source_key: str, target_unseen: int, batch_size: int = 8,
+                         answer_first: bool = False, is_active=None) -> int:
+    """Generate questions into a document's bank until it holds `target_unseen` unseen ones.
+
+    Meant to run in the background after a game has been served. Documents
+    served in fewer than MIN_GAMES_FOR_TOP_UP games are skipped, since most
+    uploads are never played again. `is_active()` is checked before each batch;
+    once it returns False the questions generated so far are kept and the
+    top-up stops. Returns the number of questions added.
+    """
+    import tempfile
+    import shutil
+    temp_dir = tempfile.mkdtemp()
+    input_path = os.path.join(temp_dir, 'combined_output.txt')
+
+    try:
+        if not download_file(source_key, input_path):
+            raise FileNotFoundError(f"Could not download {source_key} from S3")
+
+        doc_hash = document_hash(input_path)
+        bank = QuestionBank.load(doc_hash)
+        needed = target_unseen - bank.unseen_count()
+        if needed <= 0 or bank.games_served < MIN_GAMES_FOR_TOP_UP:
+            return 0
+        if is_active and not is_active():
+            return 0
+
+        logger.info(f"Topping up question bank {doc_hash[:12]} with {needed} questions")
+        models = load_models()
+        store = get_chunk_store(input_path, models, doc_hash, wait=True)
+        scheduler = make_scheduler(store, needed, doc_hash, batch_size)
+        generated = []
+        generate_qa_pairs(
+            stream_chunks(input_path, models, doc_hash, store=store, scheduler=scheduler), models, needed,
+            batch_size=batch_size, answer_first=answer_first, is_active=is_active,
+            accept=lambda qa_pair: not bank.contains(qa_pair), on_question=lambda qa_pairs: generated.append(qa_pairs[-1]),
+            store=store, scheduler=scheduler
+        )
+        added = bank.add(generated, served=False)
+        if added:
+            bank.save()
+        logger.info(f"Added {added} questions to question bank {doc_hash[:12]}")
+        return added
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_questions', type=int, required=True)
+    parser.add_argument('--game_code', type=str, required=True)
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--source_key', type=str, default=None)
+    parser.add_argument('--answer_first', action='store_true')
+    args = parser.parse_args()
+    run_generation(args.game_code, args.num_questions, batch_size=args.batch_size, source_key=args.source_key,
+                   answer_first=args.answer_first)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -56,12 +56,66 @@ const wsState = {
 function getS3Paths(gameCode) {
     return {
         QUESTIONS: `questions/${gameCode}/questions.json`,
+        QUESTIONS_MANIFEST: `questions/${gameCode}/manifest.json`,
+        QUESTION_PARTS: `questions/${gameCode}/parts/`,
         UPLOADS: `uploads/${gameCode}/`,
         STATUS: `status/${gameCode}/status.json`,
         COMBINED_OUTPUT: `outputs/${gameCode}/combined_output.txt`
     };
 }
 
+// Load the questions published so far while generation is still running
+async function loadStreamedQuestions(gameCode) {
+    const manifest = JSON.parse(await s3Utils.getFile(getS3Paths(gameCode).QUESTIONS_MANIFEST));
+    const parts = await Promise.all(manifest.parts.map(key => s3Utils.getFile(key)));
+    return {
+        questions: parts.map(part => JSON.parse(part)),
+        complete: manifest.complete
+    };
+}
+
+// Add questions published after a game started to the running game and its players
+function appendQuestions(gameCode, questions) {
+    const game = activeGames.get(gameCode);
+    if (!game || !questions || questions.length <= game.questions.length) {
+        return;
+    }
+    game.questions = game.questions.concat(questions.slice(game.questions.length));
+    broadcastToGame(gameCode, {
+        type: 'questions_added',
+        questions: game.questions
+    });
+}
+
+// Poll the manifest of a game started before generation finished, until it completes
+function followStreamedQuestions(gameCode) {
+    const poll = setInterval(async () => {
+        if (!activeGames.has(gameCode)) {
+            clearInterval(poll);
+            return;
+        }
+        try {
+            const streamed = await loadStreamedQuestions(gameCode);
+            appendQuestions(gameCode, streamed.questions);
+            if (streamed.complete) {
+                clearInterval(poll);
+            }
+        } catch (err) {
+            // Manifest not written yet or being replaced; try again next time
+        }
+    }, 2000);
+    return poll;
+}
+
+// Remove the streamed questions of an earlier run, so they can't be served for a new one
+async function clearStreamedQuestions(gameCode) {
+    const s3Paths = getS3Paths(gameCode);
+    await Promise.all([
+        s3Utils.deleteFile(s3Paths.QUESTIONS_MANIFEST),
+        s3Utils.clearDirectory(s3Paths.QUESTION_PARTS)
+    ]);
+}
+
 // Update storage configuration for multer to use memory storage
 const upload = multer({ 
     storage: multer.memoryStorage(),
@@ -84,6 +138,51 @@ const clearDirectory = async (prefix) => {
 // Define Python path to use virtual environment
 const pythonPath = path.join(__dirname, 'env', 'bin', 'python');
 
+// Resident question generation worker, so models are loaded once instead of per game
+const questionWorkerScript = path.join(__dirname, 'ml_models/models/generation_worker.py');
+let questionWorker = null;
+// Restart backoff: doubles after each quick crash, reset once the worker stays up
+const QUESTION_WORKER_MIN_RESTART_MS = 5000;
+const QUESTION_WORKER_MAX_RESTART_MS = 5 * 60 * 1000;
+const QUESTION_WORKER_MAX_RESTARTS = 10;
+const QUESTION_WORKER_STABLE_MS = 60 * 1000;
+let questionWorkerRestarts = 0;
+
+function startQuestionWorker() {
+    const startedAt = Date.now();
+    questionWorker = spawn(pythonPath, [questionWorkerScript, '--serve']);
+
+    questionWorker.stdout.on('data', (data) => {
+        console.log('Question Worker:', data.toString());
+    });
+
+    questionWorker.stderr.on('data', (data) => {
+        console.error('Question Worker Error:', data.toString());
+    });
+
+    questionWorker.on('error', (error) => {
+        log(logLevels.ERROR, 'Failed to start question worker', { error: error.message });
+    });
+
+    questionWorker.on('close', (code) => {
+        questionWorker = null;
+        if (Date.now() - startedAt >= QUESTION_WORKER_STABLE_MS) {
+            questionWorkerRestarts = 0;
+        }
+        if (questionWorkerRestarts >= QUESTION_WORKER_MAX_RESTARTS) {
+            // Games still generate in-process through the worker client's fallback
+            log(logLevels.ERROR, 'Question worker keeps crashing, giving up on restarts', {
+                code, restarts: questionWorkerRestarts
+            });
+            return;
+        }
+        const delay = Math.min(QUESTION_WORKER_MIN_RESTART_MS * 2 ** questionWorkerRestarts, QUESTION_WORKER_MAX_RESTART_MS);
+        questionWorkerRestarts += 1;
+        log(logLevels.WARN, 'Question worker exited, restarting', { code, delay, restart: questionWorkerRestarts });
+        setTimeout(startQuestionWorker, delay);
+    });
+}
+
 // Update upload endpoint
 app.post("/api/upload", async (req, res) => {
     try {
@@ -100,6 +199,7 @@ app.post("/api/upload", async (req, res) => {
         await s3Utils.deleteFile(getS3Paths(req.body.gameCode).QUESTIONS);
         await s3Utils.deleteFile(getS3Paths(req.body.gameCode).COMBINED_OUTPUT);
         await s3Utils.deleteFile(getS3Paths(req.body.gameCode).STATUS);
+        await clearStreamedQuestions(req.body.gameCode);
         
         upload.array("files")(req, res, async (err) => {
             if (err) {
@@ -323,6 +423,8 @@ app.get("/api/status", async (req, res) => {
                 progress: status.progress || 0,
                 total_questions: status.total_questions,
                 questions_generated: status.questions_generated,
+                questions_ready: status.questions_ready || 0,
+                first_questions_ready: status.first_questions_ready || false,
                 timestamp: status.timestamp
             });
         } else {
@@ -349,8 +451,15 @@ app.get("/api/questions", async (req, res) => {
     try {
         log(logLevels.INFO, 'Reading questions from S3', { path: getS3Paths(req.query.gameCode).QUESTIONS });
         
-        const questionsFile = await s3Utils.getFile(getS3Paths(req.query.gameCode).QUESTIONS);
-        const questionsData = JSON.parse(questionsFile.toString());
+        let questionsData;
+        try {
+            const questionsFile = await s3Utils.getFile(getS3Paths(req.query.gameCode).QUESTIONS);
+            questionsData = JSON.parse(questionsFile.toString());
+        } catch (err) {
+            // Generation still running: serve the questions streamed so far
+            log(logLevels.INFO, 'Falling back to streamed questions', { gameCode: req.query.gameCode });
+            questionsData = await loadStreamedQuestions(req.query.gameCode);
+        }
         
         log(logLevels.INFO, 'Sending questions data', { questionCount: questionsData.questions?.length });
         res.status(200).json(questionsData);
@@ -444,6 +553,12 @@ wss.on('connection', (ws) => {
                         const questionsResponse = await fetch(`http://localhost:5000/api/questions?gameCode=${data.gameCode}`);
                         const questionsData = await questionsResponse.json();
                         game.questions = questionsData.questions;
+                        game.started = true;
+                        // Started on the first streamed questions: keep adding the rest
+                        if (questionsData.complete === false) {
+                            clearInterval(game.streamPoll);
+                            game.streamPoll = followStreamedQuestions(data.gameCode);
+                        }
 
                         game.currentQuestion = 0;
                         game.timeLeft = game.timePerQuestion; // Ensure timer uses user-selected value for first question
@@ -853,7 +968,8 @@ app.post("/api/game/:gameCode/start", async (req, res) => {
 
 // Helper function to run question generation
 function runQuestionGeneration(gameCode) {
-    const questionScript = path.join(__dirname, 'ml_models/models/t5_model.py');
+    // Thin client: forwards the job to the resident worker, or runs t5_model.py in-process if it is down
+    const questionScript = questionWorkerScript;
     const game = activeGames.get(gameCode); // Get the correct game
     if (!game) {
         console.error(`No game found for gameCode: ${gameCode}`);
@@ -861,9 +977,15 @@ function runQuestionGeneration(gameCode) {
     }
 
     console.log(`Starting question generation for game ${gameCode} with ${game.numQuestions} questions`);
+
+    // A new run replaces the questions of any game started on the previous one
+    clearInterval(game.streamPoll);
+    game.started = false;
     
-    // Get current status to preserve progress - don't reset it!
-    s3Utils.getFile(getS3Paths(gameCode).STATUS)
+    // Drop any manifest left by an earlier run, then get current status to preserve progress - don't reset it!
+    clearStreamedQuestions(gameCode)
+        .catch(error => log(logLevels.ERROR, 'Failed to clear streamed questions', { error: error.message, gameCode }))
+        .then(() => s3Utils.getFile(getS3Paths(gameCode).STATUS))
         .then(existingStatusFile => {
             let currentProgress = 0;
             try {
@@ -956,7 +1078,13 @@ function runQuestionGeneration(gameCode) {
                         const questionsFile = await s3Utils.getFile(getS3Paths(gameCode).QUESTIONS);
                         const questionsData = JSON.parse(questionsFile);
                         if (questionsData.questions && questionsData.questions.length > 0) {
-                            game.questions = questionsData.questions;
+                            if (game.started) {
+                                // Already playing the streamed questions; just add the rest
+                                clearInterval(game.streamPoll);
+                                appendQuestions(gameCode, questionsData.questions);
+                            } else {
+                                game.questions = questionsData.questions;
+                            }
                             game.status = 'ready';
                             broadcastToGame(gameCode, {
                                 type: 'game_ready',
@@ -978,7 +1106,12 @@ function runQuestionGeneration(gameCode) {
                             const questionsFile = await s3Utils.getFile(getS3Paths(gameCode).QUESTIONS);
                             const questionsData = JSON.parse(questionsFile);
                             if (questionsData.questions && questionsData.questions.length > 0) {
-                                game.questions = questionsData.questions;
+                                if (game.started) {
+                                    clearInterval(game.streamPoll);
+                                    appendQuestions(gameCode, questionsData.questions);
+                                } else {
+                                    game.questions = questionsData.questions;
+                                }
                                 game.status = 'ready';
                                 broadcastToGame(gameCode, {
                                     type: 'game_ready',
@@ -1292,6 +1425,7 @@ async function cleanupGameFiles(gameCode) {
         const s3Paths = getS3Paths(gameCode);
         await Promise.all([
             s3Utils.deleteFile(s3Paths.QUESTIONS),
+            clearStreamedQuestions(gameCode),
             s3Utils.deleteFile(s3Paths.STATUS),
             s3Utils.deleteFile(s3Paths.COMBINED_OUTPUT),
             s3Utils.clearDirectory(s3Paths.UPLOADS)
@@ -1344,4 +1478,5 @@ async function cleanupGameFiles(gameCode) {
 const PORT = process.env.PORT || 5000;
 server.listen(PORT, () => {
     console.log(`Server running on port ${PORT} in ${process.env.NODE_ENV} mode`);
+    startQuestionWorker();
 });
\ No newline at end of file